@@ -0,0 +1,36 @@
+"""
+位相法の関係フラグ表 (relation_table.bin) の生成スクリプト。
+
+60干支 x 60干支 の組み合わせごとの REL_* フラグ (干合・支合・対冲・…) を
+sanmei_engine の判定ルールから組み立て、import 時に読むだけで済むよう
+バイナリに詰めて出力する。
+
+ファイル形式 (リトルエンディアン):
+    b"RELT" + uint32 ルール指紋 + uint16 要素数 (60 x 60)
+    + 要素数個の uint16 (添字 = 干支コード1 * 60 + 干支コード2, 甲子 = 0)
+
+判定ルール (SHIGO_PAIRS などの定数) を変更したら再生成すること。
+指紋が合わないファイルは無視され、import 時に表を組み立て直す。
+    python build_relation_table.py
+"""
+import struct
+import sys
+from array import array
+
+from sanmei_engine import SanmeiEngine, _build_relation_table, _relation_rules_fingerprint
+
+OUTPUT_PATH = SanmeiEngine.RELATION_TABLE_PATH
+
+
+def main():
+    packed = array("H", _build_relation_table())
+    if sys.byteorder != "little":
+        packed.byteswap()
+    with open(OUTPUT_PATH, "wb") as f:
+        f.write(b"RELT" + struct.pack("<IH", _relation_rules_fingerprint(), len(packed)))
+        f.write(packed.tobytes())
+    print(f"Wrote {OUTPUT_PATH} ({len(packed)} entries)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+節入り表 (setsuiri_table.bin) の生成スクリプト。
+
+各月の「節」(小寒・立春・啓蟄・…・大雪) の瞬間を、太陽の地心視黄経が
+285°, 315°, 345°, … に達する時刻として PyEphem (VSOP87) で求め、
+日本標準時 (UTC+9) の「日・分」に丸めて詰めたバイナリを出力する。
+
+ファイル形式 (リトルエンディアン):
+    b"SETU" + uint16 開始年 + uint16 年数
+    + 年数 x 12 個の uint16 ((日 - 1) * 1440 + その日の0時からの分)
+
+実行時 (sanmei_engine) は ephem を必要とせず、このファイルを読むだけである。
+    pip install ephem && python build_setsuiri_table.py
+"""
+import datetime
+import math
+import struct
+import sys
+from array import array
+
+import ephem
+
+FIRST_YEAR = 1800
+LAST_YEAR = 2199
+OUTPUT_PATH = "setsuiri_table.bin"
+JST = datetime.timedelta(hours=9)
+
+
+def apparent_solar_longitude(date):
+    sun = ephem.Sun()
+    sun.compute(date, epoch=date)
+    # g_ra / g_dec は章動・光行差を含む地心視位置
+    ecl = ephem.Ecliptic(ephem.Equatorial(sun.g_ra, sun.g_dec, epoch=date), epoch=date)
+    return math.degrees(ecl.lon)
+
+
+def find_setsuiri(year, month):
+    # 1月=小寒(285°) から 30° ずつ進む
+    target = (285 + 30 * (month - 1)) % 360
+    lo = ephem.Date(datetime.datetime(year, month, 1)) - 3
+    hi = lo + 14
+    for _ in range(50):
+        mid = ephem.Date((lo + hi) / 2)
+        if ((apparent_solar_longitude(mid) - target + 180) % 360) - 180 < 0:
+            lo = mid
+        else:
+            hi = mid
+    moment = ephem.Date(hi).datetime() + JST
+    # 秒は切り上げ (節入り時刻の「分」以降を新しい月とする)
+    if moment.second or moment.microsecond:
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    if moment.month != month:
+        raise ValueError(f"{year}/{month}: 節入りが月をまたいでいます ({moment})")
+    return moment
+
+
+def main():
+    packed = array("H")
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        for month in range(1, 13):
+            moment = find_setsuiri(year, month)
+            packed.append((moment.day - 1) * 1440 + moment.hour * 60 + moment.minute)
+        if year % 50 == 0:
+            print(f"{year}: done", file=sys.stderr)
+
+    if sys.byteorder != "little":
+        packed.byteswap()
+    with open(OUTPUT_PATH, "wb") as f:
+        f.write(b"SETU" + struct.pack("<HH", FIRST_YEAR, LAST_YEAR - FIRST_YEAR + 1))
+        f.write(packed.tobytes())
+    print(f"Wrote {OUTPUT_PATH} ({FIRST_YEAR}-{LAST_YEAR}, {len(packed)} entries)")
+
+
+if __name__ == "__main__":
+    main()
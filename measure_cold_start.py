@@ -0,0 +1,99 @@
+"""
+API のコールドスタート計測。
+
+新しい Python プロセスで webapp.backend.api を import し、
+  1. import 時間の内訳 (python -X importtime をパッケージ単位に集計)
+  2. 起動直後の最初のリクエストのレイテンシ (/healthz, /calculate, /ai/consult)
+を RUNS 回測って中央値を表示する。AI は AI_BACKEND=stub で呼ぶため、
+/ai/consult の値は google.genai の遅延 import とプロンプト組み立ての分だけを表す。
+    python measure_cold_start.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# import 名の先頭 -> 集計グループ
+IMPORT_GROUPS = [
+    ("google", "google-genai / google-auth"),
+    ("httpx", "google-genai / google-auth"),
+    ("requests", "google-genai / google-auth"),
+    ("fastapi", "fastapi / starlette / pydantic"),
+    ("starlette", "fastapi / starlette / pydantic"),
+    ("pydantic", "fastapi / starlette / pydantic"),
+    ("pydantic_core", "fastapi / starlette / pydantic"),
+    ("uvicorn", "uvicorn"),
+    ("sanmei_engine", "sanmei_engine"),
+    ("webapp", "webapp.backend (own modules)"),
+]
+
+FIRST_REQUESTS = r"""
+import json, os, time
+os.environ["AI_BACKEND"] = "stub"
+os.environ["AI_WARM_ON_STARTUP"] = "0"
+started = time.perf_counter()
+from webapp.backend import api
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+timings = {"import webapp.backend.api": imported - started}
+with TestClient(api.app) as client:
+    def timed(name, method, path, **kwargs):
+        t = time.perf_counter()
+        response = client.request(method, path, **kwargs)
+        timings[name] = time.perf_counter() - t
+        assert response.status_code < 400, (path, response.status_code, response.text)
+        return response
+    timed("first GET /healthz", "GET", "/healthz")
+    report = timed("first POST /calculate", "POST", "/calculate",
+                   json={"birthday": "1990-05-15", "gender": "男"}).json()["report"]
+    timed("second POST /calculate (other date)", "POST", "/calculate",
+          json={"birthday": "1984-11-03", "gender": "女"})
+    timed("first POST /ai/consult (stub)", "POST", "/ai/consult", json={"report": report})
+    timed("second POST /ai/consult (stub, other persona)", "POST", "/ai/consult",
+          json={"report": report, "persona": "onmyoji"})
+print(json.dumps(timings))
+"""
+
+
+def run_python(args, env_extra=None):
+    env = dict(os.environ, PYTHONPATH=ROOT, **(env_extra or {}))
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def import_breakdown():
+    # -X importtime は stderr に "import time: self [us] | cumulative | name" を出す
+    stderr = run_python(["-X", "importtime", "-c", "import webapp.backend.api"]).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        top = name.strip().split(".")[0]
+        group = next((g for prefix, g in IMPORT_GROUPS if top == prefix), "other (stdlib / third party)")
+        totals[group] = totals.get(group, 0) + int(self_us)
+    return totals
+
+
+def main():
+    breakdowns = [import_breakdown() for _ in range(RUNS)]
+    groups = sorted({g for b in breakdowns for g in b}, key=lambda g: -statistics.median(b.get(g, 0) for b in breakdowns))
+    print(f"Import time of webapp.backend.api (median of {RUNS}, ms)")
+    total = 0
+    for group in groups:
+        ms = statistics.median(b.get(group, 0) for b in breakdowns) / 1000
+        total += ms
+        print(f"  {group:<40} {ms:8.1f}")
+    print(f"  {'total':<40} {total:8.1f}")
+
+    runs = [json.loads(run_python(["-c", FIRST_REQUESTS]).stdout.strip().splitlines()[-1]) for _ in range(RUNS)]
+    print(f"\nFirst-request latency after a cold start (median of {RUNS}, ms)")
+    for name in runs[0]:
+        print(f"  {name:<48} {statistics.median(r[name] for r in runs) * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
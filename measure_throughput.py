@@ -0,0 +1,109 @@
+"""
+単一プロセス (uvicorn) とマルチプロセス (gunicorn.conf.py) のスループット比較。
+
+各構成でサーバーを起動し、CONCURRENCY 本の接続から DURATION 秒間
+  - POST /calculate   (毎回違う生年月日 = キャッシュなしのエンジン計算)
+  - POST /ai/consult  (AI_BACKEND=stub, AI_STUB_DELAY 秒かかるモデル呼び出し)
+を AI_SHARE の割合で混ぜて投げ、エンドポイント別の件数/秒と p50/p95 を表示する。
+    python measure_throughput.py [WEB_CONCURRENCY ...]
+"""
+import datetime
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PORT = 8765
+DURATION = 15
+CONCURRENCY = 16
+AI_SHARE = 0.25
+STUB_DELAY = "1.0"
+
+
+def serve(command, env_extra):
+    env = dict(os.environ, PYTHONPATH=ROOT, PORT=str(PORT), AI_BACKEND="stub", AI_STUB_DELAY=STUB_DELAY,
+               AI_WARM_ON_STARTUP="0", **env_extra)
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{PORT}/healthz", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"Server did not start: {command}")
+
+
+def load(report):
+    birthdays = (datetime.date(1940, 1, 1) + datetime.timedelta(days=i) for i in itertools.count())
+    lock = threading.Lock()
+    latencies = {"calculate": [], "ai/consult": [], "errors": []}
+    stop_at = time.monotonic() + DURATION
+
+    def client(n):
+        with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=60) as c:
+            for i in itertools.count():
+                if time.monotonic() >= stop_at:
+                    return
+                ai = (i * CONCURRENCY + n) % round(1 / AI_SHARE) == 0
+                t = time.perf_counter()
+                if ai:
+                    # Distinct message per call so the response cache doesn't answer it
+                    r = c.post("/ai/consult", json={"report": report, "persona": "jiya", "message": f"{n}-{i}",
+                                                    "history": [{"role": "user", "content": "x"}]})
+                else:
+                    with lock:
+                        birthday = next(birthdays).isoformat()
+                    r = c.post("/calculate", json={"birthday": birthday, "gender": "男"})
+                with lock:
+                    latencies["errors" if r.status_code >= 400 else "ai/consult" if ai else "calculate"].append(
+                        time.perf_counter() - t)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(CONCURRENCY)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def main():
+    worker_counts = [int(w) for w in sys.argv[1:]] or [2]
+    configs = [("uvicorn, 1 process", ["uvicorn", "webapp.backend.api:app", "--port", str(PORT)], {})]
+    for workers in worker_counts:
+        configs.append((f"gunicorn.conf.py, {workers} workers",
+                        ["gunicorn", "-c", "gunicorn.conf.py", "webapp.backend.api:app"],
+                        {"WEB_CONCURRENCY": str(workers)}))
+
+    print(f"{DURATION}s, {CONCURRENCY} connections, {AI_SHARE:.0%} AI calls (stub, {STUB_DELAY}s), "
+          f"{os.cpu_count()} CPU(s)")
+    for name, command, env_extra in configs:
+        proc = serve(command, env_extra)
+        try:
+            report = httpx.post(f"http://127.0.0.1:{PORT}/calculate",
+                                json={"birthday": "1990-05-15", "gender": "男"}).json()["report"]
+            latencies = load(report)
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"\n{name}")
+        for endpoint in ("calculate", "ai/consult"):
+            values = sorted(latencies[endpoint])
+            if not values:
+                continue
+            p95 = values[int(len(values) * 0.95) - 1]
+            print(f"  {endpoint:<12} {len(values) / DURATION:7.1f} req/s   "
+                  f"p50 {statistics.median(values) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+        if latencies["errors"]:
+            print(f"  errors       {len(latencies['errors'])}")
+
+
+if __name__ == "__main__":
+    main()
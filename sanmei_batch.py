@@ -0,0 +1,199 @@
+import numpy as np
+
+from sanmei_engine import Kanshi, SanmeiEngine
+
+# ============================================
+# 一括計算用の整数表 (import時に一度だけ構築)
+# ============================================
+# 十大主星・十二大従星はコード(0始まり)で返し、名称は以下の表で復元する
+JUDAI_SHUSEI_NAMES = list(dict.fromkeys(SanmeiEngine.JUDAI_SHUSEI_MAP.values()))
+JUNIDAI_JUSEI_NAMES = list(SanmeiEngine.JUNIDAI_JUSEI_SCORE.keys())
+TENCHUSATSU_NAMES = SanmeiEngine.TENCHUSATSU_BY_SHUN
+
+_JUDAI_CODE = np.array(
+    [[JUDAI_SHUSEI_NAMES.index(star) for star in row] for row in SanmeiEngine.JUDAI_SHUSEI_MATRIX],
+    dtype=np.int8,
+)
+_JUNIDAI_CODE = np.array(
+    [[JUNIDAI_JUSEI_NAMES.index(star) for star in row] for row in SanmeiEngine.JUNIDAI_JUSEI_MATRIX],
+    dtype=np.int8,
+)
+_JUNIDAI_SCORE = np.array(SanmeiEngine.JUNIDAI_SCORE_MATRIX, dtype=np.int32)
+
+# 支番号 -> 蔵干(全て)の干番号ごとの個数
+_ZOKAN_COUNT = np.zeros((12, 10), dtype=np.int32)
+for _z, _stems in enumerate(SanmeiEngine.ZOKAN_STEMS):
+    for _g in _stems:
+        _ZOKAN_COUNT[_z, _g] += 1
+
+# (支番号, 節日数) -> 動的蔵干の干番号 (スカラー版と同じ ZOKAN_BY_DAY)
+_ZOKAN_BY_DAY = np.array(
+    [[g if n else 0 for n, g in enumerate(row)] for row in SanmeiEngine.ZOKAN_BY_DAY],
+    dtype=np.int8,
+)
+
+_GAN_WX = np.array(Kanshi.GAN_WX, dtype=np.int64)
+_GAN_YY = np.array(Kanshi.GAN_YY, dtype=np.int64)
+# 干番号 -> 五行 の one-hot (10 x 5)。干ごとの値に右から掛けると五行ごとの合計になる
+_GAN_WX_ONEHOT = np.eye(5, dtype=np.int64)[_GAN_WX]
+
+# 干支コード -> 数理法の柱の増分 (干の個数, 地支から各干へのスコア)。行 60 は「柱なし」(立運前の大運)
+_NO_PILLAR = 60
+_PILLAR_STEM_COUNT = np.zeros((61, 10), dtype=np.int64)
+_PILLAR_STEM_COUNT[:60] = SanmeiEngine.ENERGY_STEM_COUNT
+_PILLAR_BRANCH_SCORE = np.zeros((61, 10), dtype=np.int64)
+_PILLAR_BRANCH_SCORE[:60] = [SanmeiEngine.ENERGY_BRANCH_SCORE[c % 12] for c in range(60)]
+
+
+def _setsuiri_table(first_year, last_year):
+    # 年 x 月 の節入り日。値はスカラー版 get_setsuiri_day をそのまま使う
+    return np.array(
+        [[SanmeiEngine.get_setsuiri_day(y, m) for m in range(1, 13)] for y in range(first_year, last_year + 1)],
+        dtype=np.int64,
+    )
+
+
+def _to_dates(dates):
+    # datetime.date / "YYYY-MM-DD" / datetime64 のいずれも受け付ける
+    return np.asarray(dates, dtype="datetime64[D]").reshape(-1)
+
+
+def compute_batch(dates, genders="M"):
+    """
+    生年月日の配列から陰占・陽占の主要値を列ごとの整数配列で一括算出する。
+    スカラー版 SanmeiEngine(y, m, d) と同じ節入り・参照表を使うため、結果は1件ずつ計算した場合と一致する。
+    """
+    dt = _to_dates(dates)
+    n = len(dt)
+    genders = np.broadcast_to(np.asarray(genders), (n,))
+
+    month_start = dt.astype("datetime64[M]")
+    y = dt.astype("datetime64[Y]").astype(np.int64) + 1970
+    m = month_start.astype(np.int64) % 12 + 1
+    d = (dt - month_start.astype("datetime64[D]")).astype(np.int64) + 1
+
+    # 節入り表 (大運の順行で翌年1月を参照するため1年余分に持つ)
+    first_year = int(y.min()) if n else 1900
+    last_year = int(y.max()) + 1 if n else 1900
+    setsu = _setsuiri_table(first_year, last_year)
+    y_row = y - first_year
+
+    # 1. 日干支 (1900/1/1 = 甲戌(11) を基準)
+    diff_days = (dt - np.datetime64("1900-01-01")).astype(np.int64)
+    day_id = (diff_days + 11 - 1) % 60 + 1
+    nikkan = (day_id - 1) % 10
+    nishi = (day_id - 1) % 12
+
+    # 2. 年干支 (立春が年の境, 1900年 = 庚子(37))
+    setsu_feb = setsu[y_row, 1]
+    y_for_nen = y - ((m < 2) | ((m == 2) & (d < setsu_feb)))
+    year_id = (y_for_nen - 1900 + 37 - 1) % 60 + 1
+    nenkan = (year_id - 1) % 10
+    neshi = (year_id - 1) % 12
+
+    # 3. 月干支 (毎月の節入りが月の境)
+    setsu_this_month = setsu[y_row, m - 1]
+    m_idx = m - (d < setsu_this_month)
+    month_code = SanmeiEngine.get_month_code(year_id - 1, m_idx)
+    month_id = month_code + 1
+    gekkan = month_code % 10
+    geshi = month_code % 12
+
+    # 蔵干 (節日数に基づく動的蔵干)
+    setsunissu = (d - setsu_this_month) % 30 + 1
+    z_nen = _ZOKAN_BY_DAY[neshi, setsunissu]
+    z_getsu = _ZOKAN_BY_DAY[geshi, setsunissu]
+    z_nichi = _ZOKAN_BY_DAY[nishi, setsunissu]
+
+    # 陽占
+    judai_row = _JUDAI_CODE[nikkan]
+    junidai_row = _JUNIDAI_CODE[nikkan]
+    rows = np.arange(n)
+
+    # 数理法: 命式内の各干の出現数 x その干の全地支(3つ)からのスコア合計
+    score_row = _JUNIDAI_SCORE.T
+    stem_energy = score_row[neshi] + score_row[geshi] + score_row[nishi]
+    stem_count = _ZOKAN_COUNT[neshi] + _ZOKAN_COUNT[geshi] + _ZOKAN_COUNT[nishi]
+    stem_count[rows, nenkan] += 1
+    stem_count[rows, gekkan] += 1
+    stem_count[rows, nikkan] += 1
+    energy_by_stem = stem_count * stem_energy
+    energy_by_wx = np.zeros((n, 5), dtype=np.int32)
+    for wx in range(5):
+        energy_by_wx[:, wx] = energy_by_stem[:, _GAN_WX == wx].sum(axis=1)
+
+    # 大運の順行・逆行と立運 (calculate_daiun と同じ丸め)
+    is_male = genders == "M"
+    is_female = genders == "F"
+    nen_yang = _GAN_YY[nenkan] == 0
+    is_shunko = (is_male & nen_yang) | (is_female & ~nen_yang)
+    next_row = y_row + (m == 12)
+    next_m = m % 12 + 1
+    next_setsu_date = (month_start + 1).astype("datetime64[D]") + (setsu[next_row, next_m - 1] - 1)
+    this_setsu_date = month_start.astype("datetime64[D]") + (setsu_this_month - 1)
+    days_diff = np.where(
+        is_shunko,
+        (next_setsu_date - dt).astype(np.int64),
+        (dt - this_setsu_date).astype(np.int64),
+    )
+    ritsuen = np.fix(days_diff / 3).astype(np.int64) + (days_diff % 3 == 2)
+    ritsuen[ritsuen == 0] = 1
+
+    return {
+        "year_id": year_id,
+        "month_id": month_id,
+        "day_id": day_id,
+        "zokan_year": z_nen,
+        "zokan_month": z_getsu,
+        "zokan_day": z_nichi,
+        "judai_head": judai_row[rows, nenkan],
+        "judai_chest": judai_row[rows, z_getsu],
+        "judai_belly": judai_row[rows, gekkan],
+        "judai_left": judai_row[rows, z_nen],
+        "judai_right": judai_row[rows, z_nichi],
+        "junidai_early": junidai_row[rows, neshi],
+        "junidai_middle": junidai_row[rows, geshi],
+        "junidai_late": junidai_row[rows, nishi],
+        "tenchusatsu": (day_id - 1) // 10,
+        "total_energy": energy_by_stem.sum(axis=1),
+        "energy_by_wx": energy_by_wx,
+        "daiun_shunko": is_shunko,
+        "ritsuen": ritsuen,
+    }
+
+
+def compute_energy_timeline(engine, gender, from_year, to_year):
+    """
+    宿命 (engine の3柱) にその年の大運・年運の柱を加えた数理法を [from_year, to_year] の各年について一括算出する。
+    数理法は干ごとの「個数 x 全地支からのスコア和」なので、宿命の2つのベクトルに大運・年運の柱の増分を
+    足して掛けるだけで各年が求まる (EnergyProfile.from_codes に5柱を渡した結果と一致する)。
+    立運前の年は大運なし (daiun_code = -1)。
+    """
+    years = np.arange(from_year, to_year + 1, dtype=np.int64)
+    ages = years - engine.year
+
+    # その年の大運 (get_daiun と同じく第i運は 立運 + (i-1)*10 歳から) と年運の干支コード
+    is_shunko, ritsuen = engine.get_daiun_direction(gender)
+    cycle = (ages - ritsuen) // 10 + 1
+    daiun = np.where(ages >= ritsuen, (engine.month_code + (cycle if is_shunko else -cycle)) % 60, _NO_PILLAR)
+    nenun = (years - SanmeiEngine.NENUN_BASE_YEAR) % 60
+
+    natal = list(engine.kanshi_codes)
+    stem_count = _PILLAR_STEM_COUNT[natal].sum(axis=0) + _PILLAR_STEM_COUNT[daiun] + _PILLAR_STEM_COUNT[nenun]
+    branch_score = _PILLAR_BRANCH_SCORE[natal].sum(axis=0) + _PILLAR_BRANCH_SCORE[daiun] + _PILLAR_BRANCH_SCORE[nenun]
+    energy_by_stem = stem_count * branch_score
+    energy_by_wx = energy_by_stem @ _GAN_WX_ONEHOT
+
+    # 八門法: HACHIMON_GATES の順に、日干の五行からのずれで五行分布の列を並べ替える
+    day_wx = Kanshi.GAN_WX[engine.day_gan]
+    gates = [(day_wx + offset) % 5 for _, offset in SanmeiEngine.HACHIMON_GATES]
+
+    return {
+        "year": years,
+        "age": ages,
+        "daiun_code": np.where(daiun == _NO_PILLAR, -1, daiun),
+        "nenun_code": nenun,
+        "total_energy": energy_by_stem.sum(axis=1),
+        "energy_by_wx": energy_by_wx,
+        "hachimon": energy_by_wx[:, gates],
+    }
@@ -1,5 +1,12 @@
 import datetime
+import functools
 import math
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
 
 class Kanshi:
     TIAN_GAN = ["甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸"]
@@ -18,13 +25,29 @@ class Kanshi:
         "酉": "-", "亥": "+", "子": "-", "辰": "+", "未": "-",
         "戌": "+", "丑": "-"
     }
+    WU_XING_ORDER = ["木", "火", "土", "金", "水"]
+
+    # エンジン内部では干・支・干支を整数コードで扱う:
+    #   干コード 0〜9 (TIAN_GAN 順)、支コード 0〜11 (DI_ZHI 順)、干支コード 0〜59 (甲子=0)
+    #   干支コード c の干は c % 10、支は c % 12。表示上の干支番号 (1〜60) は c + 1
+    # 文字は入出力の境界 (レポートの組み立て・文字を受け取る公開メソッド) でだけ使う
+
+    # 以下の整数インデックス表はモジュール末尾の _build_tables() で import 時に一度だけ構築する
+    # GAN_INDEX / ZHI_INDEX: 文字 -> 0始まりの番号
+    # KANSHI_BY_ID: 干支番号 (1〜60) -> (干, 支)、KANSHI_ID: (干, 支) -> 干支番号
+    # KANSHI_NAME: 干支コード (0〜59) -> "甲子"
+    # GAN_WX / ZHI_WX: 番号 -> 五行番号 (WU_XING_ORDER 順)、GAN_YY / ZHI_YY: 番号 -> 陰陽 (0=陽, 1=陰)
     
     @classmethod
     def get_kanshi_id(cls, gan, zhi):
-        for i in range(1, 61):
-            if cls.TIAN_GAN[(i-1)%10] == gan and cls.DI_ZHI[(i-1)%12] == zhi:
-                return i
-        return None
+        # (干, 支) -> 干支番号 (1〜60)。存在しない組み合わせは None
+        return cls.KANSHI_ID.get((gan, zhi))
+
+    @staticmethod
+    def kanshi_code(gan_idx, zhi_idx):
+        # (干コード, 支コード) -> 干支コード (0〜59)。c % 10 == gan_idx かつ c % 12 == zhi_idx を満たす c
+        # (陰陽の合う組み合わせのみ。6 * gan - 5 * zhi は中国剰余定理による解)
+        return (6 * gan_idx - 5 * zhi_idx) % 60
 
 class SanmeiEngine:
     # 蔵干表 (地支: [(蔵干, 配分日数), ...])
@@ -56,6 +79,20 @@ class SanmeiEngine:
         ("剋出", "同"): "禄存星", ("剋出", "異"): "司禄星"
     }
 
+    # 十二大従星判定表 (日干 -> 地支 -> 星)
+    JUNIDAI_JUSEI_TABLE = {
+        "甲": {"子": "天恍", "丑": "天南", "寅": "天禄", "卯": "天将", "辰": "天堂", "巳": "天胡", "午": "天極", "未": "天庫", "申": "天馳", "酉": "天報", "戌": "天印", "亥": "天貴"},
+        "乙": {"子": "天胡", "丑": "天堂", "寅": "天将", "卯": "天禄", "辰": "天南", "巳": "天恍", "午": "天貴", "未": "天印", "申": "天報", "酉": "天馳", "戌": "天庫", "亥": "天極"},
+        "丙": {"子": "天報", "丑": "天印", "寅": "天貴", "卯": "天恍", "辰": "天南", "巳": "天禄", "午": "天将", "未": "天堂", "申": "天胡", "酉": "天極", "戌": "天庫", "亥": "天馳"},
+        "丁": {"子": "天馳", "丑": "天庫", "寅": "天極", "卯": "天胡", "辰": "天堂", "巳": "天将", "午": "天禄", "未": "天南", "申": "天恍", "酉": "天貴", "戌": "天印", "亥": "天報"},
+        "戊": {"子": "天報", "丑": "天印", "寅": "天貴", "卯": "天恍", "辰": "天南", "巳": "天禄", "午": "天将", "未": "天堂", "申": "天胡", "酉": "天極", "戌": "天庫", "亥": "天馳"},
+        "己": {"子": "天馳", "丑": "天庫", "寅": "天極", "卯": "天胡", "辰": "天堂", "巳": "天将", "午": "天禄", "未": "天南", "申": "天恍", "酉": "天貴", "戌": "天印", "亥": "天報"},
+        "庚": {"子": "天極", "丑": "天庫", "寅": "天馳", "卯": "天報", "辰": "天印", "巳": "天貴", "午": "天恍", "未": "天南", "申": "天禄", "酉": "天将", "戌": "天堂", "亥": "天胡"},
+        "辛": {"子": "天貴", "丑": "天印", "寅": "天報", "卯": "天馳", "辰": "天庫", "巳": "天極", "午": "天胡", "未": "天堂", "申": "天将", "酉": "天禄", "戌": "天南", "亥": "天恍"},
+        "壬": {"子": "天将", "丑": "天堂", "寅": "天胡", "卯": "天極", "辰": "天庫", "巳": "天馳", "午": "天報", "未": "天印", "申": "天貴", "酉": "天恍", "戌": "天南", "亥": "天禄"},
+        "癸": {"子": "天禄", "丑": "天南", "寅": "天恍", "卯": "天貴", "辰": "天印", "巳": "天報", "午": "天馳", "未": "天庫", "申": "天極", "酉": "天胡", "戌": "天堂", "亥": "天将"}
+    }
+
     # 十二大従星スコア
     JUNIDAI_JUSEI_SCORE = {
         "天報": 3, "天印": 6, "天貴": 9, "天恍": 7, "天南": 10, "天禄": 11,
@@ -76,6 +113,80 @@ class SanmeiEngine:
     NORMAL_IJOU_KANSHI = [11, 12, 35, 37, 48, 54]
     ANGO_IJOU_KANSHI = [18, 19, 23, 24, 25, 30, 36]
 
+    # 節入り表 (build_setsuiri_table.py で生成、import時に一度だけ読み込む)
+    # SETSUIRI_TABLE[(年 - SETSUIRI_FIRST_YEAR) * 12 + (月 - 1)] = 節入り時刻 (月初0時からの分, 日本時間)
+    SETSUIRI_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "setsuiri_table.bin")
+    # 位相法の関係フラグ表のスナップショット (build_relation_table.py で生成)
+    # 判定ルールの指紋が一致しない・ファイルが無い場合は import 時に組み立て直す
+    RELATION_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "relation_table.bin")
+
+    # 以下の参照表は _build_tables() で構築する (いずれも日干/対象を添字とする)
+    # RELATIONSHIP_TABLE: (干, 干) -> (五行関係, 陰陽)
+    # JUDAI_SHUSEI_MATRIX[10][10] / JUDAI_SHUSEI_LOOKUP: 十大主星
+    # JUNIDAI_JUSEI_MATRIX[10][12] / JUNIDAI_JUSEI_LOOKUP: 十二大従星
+    # JUNIDAI_SCORE_MATRIX[10][12] / JUNIDAI_SCORE_LOOKUP: 十二大従星スコア
+    # ZOKAN_STEMS[12]: 支コード -> 蔵干 (全て) の干コードのタプル
+    # ZOKAN_BY_DAY[12][31]: (支コード, 節日数 1〜30) -> 動的蔵干の干コード
+    # TENCHUSATSU_ZHI_MASK[6]: 旬 (干支コード // 10) -> 天中殺の支コードのビット集合
+    # IJOU_KANSHI_TYPE[60]: 干支コード -> 異常干支の種別 (該当なしは None)
+    # ENERGY_STEM_COUNT[60]: 干支コード -> その柱の干 (天干 + 全蔵干) の干コードごとの個数
+    # ENERGY_BRANCH_SCORE[12]: 支コード -> その地支から各干へのスコア (JUNIDAI_SCORE_MATRIX の列)
+    TENCHUSATSU_BY_SHUN = ["戌亥", "申酉", "午未", "辰巳", "寅卯", "子丑"]
+
+    # 日・年・年運の干支コードの基準 (日付は西暦1年1月1日 = 1 の通日で扱う)
+    # 1900/1/1 = 甲戌(コード10)、1900年 = 庚子(コード36)、1984年 = 甲子(コード0)
+    EPOCH_ORDINAL = 693596
+    EPOCH_DAY_CODE = 10
+    EPOCH_YEAR = 1900
+    EPOCH_YEAR_CODE = 36
+    NENUN_BASE_YEAR = 1984
+    # 月の1日の前までの日数 (平年)
+    DAYS_BEFORE_MONTH = [0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+    # get_full_report の項目順 (大運のみ性別に依存)
+    REPORT_SECTIONS = ["陰占", "陽占", "天中殺", "異常干支", "位相法", "大運", "年運", "宇宙盤", "数理法", "八門法"]
+
+    # テキストレポートに載せる年運の年数
+    TEXT_REPORT_NENUN_YEARS = 20
+    # LLM 向けレポートの既定の年運年数 (天中殺は12年周期なので次の天中殺の2年が必ず入る)
+    PROMPT_NENUN_YEARS = 12
+    # 推定トークン数: かな・漢字・全角は1文字≒1トークン、それ以外は4文字≒1トークン
+    _WIDE_CHARS = re.compile(r"[^\x00-\u2e7f]")
+
+    # 位相法の組み合わせ定義
+    SHIGO_PAIRS = [("丑", "子"), ("寅", "亥"), ("卯", "戌"), ("辰", "酉"), ("巳", "申"), ("午", "未")]
+    TAICHU_PAIRS = [("子", "午"), ("丑", "未"), ("寅", "申"), ("卯", "酉"), ("辰", "戌"), ("巳", "亥")]
+    GAI_PAIRS = [("子", "未"), ("丑", "午"), ("寅", "巳"), ("卯", "辰"), ("申", "亥"), ("酉", "戌")]
+    HA_PAIRS = [("子", "酉"), ("丑", "辰"), ("寅", "亥"), ("卯", "午"), ("巳", "申"), ("未", "戌")]
+    KEI_OUKI_PAIRS = [("子", "卯")]
+    KEI_SEIKI_PAIRS = [("寅", "巳"), ("巳", "申"), ("申", "寅")]
+    KEI_KOKI_PAIRS = [("丑", "戌"), ("戌", "未"), ("未", "丑")]
+    JIKEI_ZHI = ["辰", "午", "酉", "亥"]
+    KANGOU_PAIRS = [("甲", "己"), ("乙", "庚"), ("丙", "辛"), ("丁", "壬"), ("戊", "癸")]
+    HANKAI_TRIPLETS = [("申", "子", "辰"), ("亥", "卯", "未"), ("寅", "午", "戌"), ("巳", "酉", "丑")]
+
+    # 位相法の関係フラグ (RELATION_TABLE[干支コード1 * 60 + 干支コード2] の各ビット)
+    REL_KANGOU = 1 << 0          # 干合
+    REL_SHIGO = 1 << 1           # 支合
+    REL_TAICHU = 1 << 2          # 対冲
+    REL_GAI = 1 << 3             # 害
+    REL_HA = 1 << 4              # 破
+    REL_JIKEI = 1 << 5           # 自刑
+    REL_KEI_OUKI = 1 << 6        # 旺気刑
+    REL_KEI_SEIKI = 1 << 7       # 生貴刑
+    REL_KEI_KOKI = 1 << 8        # 庫気刑
+    REL_HANKAI = 1 << 9          # 半会 (異地支)
+    REL_HIWA = 1 << 10           # 比和 (地支の五行が同じ)
+    REL_TENKOKU_CHICHU = 1 << 11 # 天剋地冲 (天干が相剋かつ地支が対冲)
+    REL_DAIHANKAI = 1 << 12      # 大半会 (半会かつ天干が同じ)
+
+    # 運の位相法の表示順 (天剋地冲の場合はそれのみを表示)
+    LUCK_RELATION_NAMES = [
+        (REL_KANGOU, "干合"), (REL_SHIGO, "支合"), (REL_TAICHU, "対冲"), (REL_GAI, "害"), (REL_HA, "破"),
+        (REL_JIKEI, "自刑"), (REL_KEI_OUKI, "旺気刑"), (REL_KEI_SEIKI, "生貴刑"), (REL_KEI_KOKI, "庫気刑"),
+        (REL_HANKAI, "半会"), (REL_HIWA, "比和"),
+    ]
+
     # 地支の五行判定用マップ (地支 -> 代表的な天干)
     DI_ZHI_TO_GAN_MAP = {
         "子": "癸", "丑": "己", "寅": "甲", "卯": "乙", "辰": "戊", "巳": "丙",
@@ -95,8 +206,7 @@ class SanmeiEngine:
     
     def get_tenchusatsu_timing_info(self):
         # 自分の天中殺グループを取得
-        tn = self.get_tenchusatsu(self.nikkan, self.nishi)
-        group_name = "".join(tn) 
+        group_name = SanmeiEngine.TENCHUSATSU_BY_SHUN[self.day_code // 10]
         
         timing = SanmeiEngine.TENCHUSATSU_TIMING.get(group_name)
         if not timing:
@@ -143,46 +253,51 @@ class SanmeiEngine:
 
     @staticmethod
     def get_relationship(gan1, gan2):
-        w1 = Kanshi.WU_XING[gan1]
-        w2 = Kanshi.WU_XING[gan2]
-        y1 = Kanshi.YIN_YANG[gan1]
-        y2 = Kanshi.YIN_YANG[gan2]
-        order = ["木", "火", "土", "金", "水"]
-        idx1 = order.index(w1)
-        idx2 = order.index(w2)
-        diff = (idx2 - idx1) % 5
-        if diff == 0: rel_type = "比和"
-        elif diff == 1: rel_type = "生出"
-        elif diff == 2: rel_type = "剋出"
-        elif diff == 3: rel_type = "剋入"
-        elif diff == 4: rel_type = "生入"
-        yy = "同" if y1 == y2 else "異"
-        return rel_type, yy
+        return SanmeiEngine.RELATIONSHIP_TABLE[(gan1, gan2)]
 
     @staticmethod
     def get_judai_shusei(nikkan, target_gan):
-        rel, yy = SanmeiEngine.get_relationship(nikkan, target_gan)
-        return SanmeiEngine.JUDAI_SHUSEI_MAP.get((rel, yy))
+        return SanmeiEngine.JUDAI_SHUSEI_LOOKUP.get((nikkan, target_gan))
 
     @staticmethod
     def get_junidai_jusei(nikkan, zhi):
-        table = {
-            "甲": {"子": "天恍", "丑": "天南", "寅": "天禄", "卯": "天将", "辰": "天堂", "巳": "天胡", "午": "天極", "未": "天庫", "申": "天馳", "酉": "天報", "戌": "天印", "亥": "天貴"},
-            "乙": {"子": "天胡", "丑": "天堂", "寅": "天将", "卯": "天禄", "辰": "天南", "巳": "天恍", "午": "天貴", "未": "天印", "申": "天報", "酉": "天馳", "戌": "天庫", "亥": "天極"},
-            "丙": {"子": "天報", "丑": "天印", "寅": "天貴", "卯": "天恍", "辰": "天南", "巳": "天禄", "午": "天将", "未": "天堂", "申": "天胡", "酉": "天極", "戌": "天庫", "亥": "天馳"},
-            "丁": {"子": "天馳", "丑": "天庫", "寅": "天極", "卯": "天胡", "辰": "天堂", "巳": "天将", "午": "天禄", "未": "天南", "申": "天恍", "酉": "天貴", "戌": "天印", "亥": "天報"},
-            "戊": {"子": "天報", "丑": "天印", "寅": "天貴", "卯": "天恍", "辰": "天南", "巳": "天禄", "午": "天将", "未": "天堂", "申": "天胡", "酉": "天極", "戌": "天庫", "亥": "天馳"},
-            "己": {"子": "天馳", "丑": "天庫", "寅": "天極", "卯": "天胡", "辰": "天堂", "巳": "天将", "午": "天禄", "未": "天南", "申": "天恍", "酉": "天貴", "戌": "天印", "亥": "天報"},
-            "庚": {"子": "天極", "丑": "天庫", "寅": "天馳", "卯": "天報", "辰": "天印", "巳": "天貴", "午": "天恍", "未": "天南", "申": "天禄", "酉": "天将", "戌": "天堂", "亥": "天胡"},
-            "辛": {"子": "天貴", "丑": "天印", "寅": "天報", "卯": "天馳", "辰": "天庫", "巳": "天極", "午": "天胡", "未": "天堂", "申": "天将", "酉": "天禄", "戌": "天南", "亥": "天恍"},
-            "壬": {"子": "天将", "丑": "天堂", "寅": "天胡", "卯": "天極", "辰": "天庫", "巳": "天馳", "午": "天報", "未": "天印", "申": "天貴", "酉": "天恍", "戌": "天南", "亥": "天禄"},
-            "癸": {"子": "天禄", "丑": "天南", "寅": "天恍", "卯": "天貴", "辰": "天印", "巳": "天報", "午": "天馳", "未": "天庫", "申": "天極", "酉": "天胡", "戌": "天堂", "亥": "天将"}
-        }
-        return table.get(nikkan, {}).get(zhi)
+        return SanmeiEngine.JUNIDAI_JUSEI_LOOKUP.get((nikkan, zhi))
+
+    @staticmethod
+    def get_month_code(year_code, m_idx):
+        # 月干 (年上起月法): 寅月は 甲・己年 -> 丙寅(2)、乙・庚年 -> 戊寅(14)... と年干ごとに12ずつ進む
+        # 節月ベースのオフセット (寅月=0, 卯月=1...) を足すと月支も 寅(2), 卯(3)... と揃う
+        # (sanmei_batch からは NumPy 配列のまま呼ばれる)
+        return (year_code % 5 * 12 + 2 + (m_idx - 2) % 12) % 60
+
+    @staticmethod
+    def to_ordinal(year, month, day):
+        # 西暦1年1月1日を 1 とする通日 (datetime.date.toordinal と同じ値)。日付の検証はしない
+        y = year - 1
+        days = y * 365 + y // 4 - y // 100 + y // 400 + SanmeiEngine.DAYS_BEFORE_MONTH[month] + day
+        if month > 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+            days += 1
+        return days
+
+    @staticmethod
+    def get_setsuiri_minute(year, month):
+        # 節入り時刻 (日本時間) を「その月の1日0時からの経過分」で返す。表の範囲外は None
+        idx = (year - SanmeiEngine.SETSUIRI_FIRST_YEAR) * 12 + (month - 1)
+        if 0 <= idx < len(SanmeiEngine.SETSUIRI_TABLE):
+            return SanmeiEngine.SETSUIRI_TABLE[idx]
+        return None
 
     @staticmethod
     def get_setsuiri_day(year, month):
-        # 節入り日の計算 (1900-2099年)
+        # 節入り日 (setsuiri_table.bin の天文計算値)
+        minute_of_month = SanmeiEngine.get_setsuiri_minute(year, month)
+        if minute_of_month is not None:
+            return minute_of_month // 1440 + 1
+        return SanmeiEngine._approx_setsuiri_day(year, month)
+
+    @staticmethod
+    def _approx_setsuiri_day(year, month):
+        # 表の範囲外の年に限り、従来の近似式を使う
         constants = {
             1: 5.41, 2: 3.82, 3: 5.59, 4: 4.90, 5: 5.01, 6: 5.12,
             7: 6.83, 8: 7.20, 9: 7.37, 10: 8.35, 11: 7.55, 12: 7.43
@@ -190,14 +305,20 @@ class SanmeiEngine:
         y = year - 1900
         # 各月の基準日の変動係数
         day = int(constants[month] + 0.242194 * y - int(y / 4))
-        # 1990年や1988年のように調整が必要な場合の境界微修正(本来は天文計算)
-        if year == 1990 and month == 9: return 8
-        if year == 1990 and month == 8: return 8
-        if year == 1988 and month == 3: return 6
-        if year == 1970 and month == 1: return 6 # 1/6 20:39 節入り
-        if year == 1905 and month == 7: return 8 # 小暑
         return day
 
+    @staticmethod
+    def is_before_setsuiri(year, month, day, hour=None, minute=None):
+        # 出生がその月の節入り前かどうか。
+        # 出生時刻が不明 (hour=None) の場合は、節入り日当日を新しい月として扱う
+        setsu_day = SanmeiEngine.get_setsuiri_day(year, month)
+        if day != setsu_day or hour is None:
+            return day < setsu_day
+        setsu_minute = SanmeiEngine.get_setsuiri_minute(year, month)
+        if setsu_minute is None:
+            return False
+        return (day - 1) * 1440 + hour * 60 + (minute or 0) < setsu_minute
+
     @staticmethod
     def get_zokan(zhi, setsunissu):
         distribution = SanmeiEngine.ZOKAN_TABLE[zhi]
@@ -213,132 +334,94 @@ class SanmeiEngine:
 
     @staticmethod
     def get_tenchusatsu(nikkan, nishi):
-        # 天中殺判定: 日干支の番号から「旬」を特定する
-        n = Kanshi.get_kanshi_id(nikkan, nishi)
-        # 旬の開始番号を求める (1, 11, 21, 31, 41, 51)
-        shun_start = ((n - 1) // 10) * 10 + 1
-        # 各旬に対応する空亡
-        mapping = {
-            1: "戌亥", 11: "申酉", 21: "午未", 
-            31: "辰巳", 41: "寅卯", 51: "子丑"
-        }
-        return mapping.get(shun_start)
+        # 天中殺判定: 日干支の干支コードから「旬」(コード // 10) を特定する
+        code = Kanshi.kanshi_code(Kanshi.GAN_INDEX[nikkan], Kanshi.ZHI_INDEX[nishi])
+        return SanmeiEngine.TENCHUSATSU_BY_SHUN[code // 10]
 
     @staticmethod
-    def get_isouhou(kanshi_list): # Changed input to kanshi_list for gan access
+    def get_relation_flags(k_id1, k_id2):
+        # 2つの干支 (干支番号 1〜60) の位相法フラグ (REL_* の組み合わせ)
+        return SanmeiEngine.RELATION_TABLE[(k_id1 - 1) * 60 + (k_id2 - 1)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def render_natal_relation(pos, z1, z2, flags):
+        # 宿命内の位相法の表示文字列 (例: "東方支合(午未)")
         results = []
-        n = len(kanshi_list)
-        
-        # Create a list of (name, gan, zhi) for easier pairing and naming
-        named_kanshi = [
-            ("年", kanshi_list[0][0], kanshi_list[0][1]),
-            ("月", kanshi_list[1][0], kanshi_list[1][1]),
-            ("日", kanshi_list[2][0], kanshi_list[2][1])
-        ]
+        if flags & SanmeiEngine.REL_SHIGO:
+            results.append(f"{pos}支合({z1}{z2})")
+        if flags & SanmeiEngine.REL_TAICHU:
+            results.append(f"{pos}対冲({z1}{z2})")
+        if flags & SanmeiEngine.REL_DAIHANKAI:
+            results.append(f"{pos}大半会({z1}{z2})")
+        elif flags & SanmeiEngine.REL_HANKAI:
+            results.append(f"{pos}半会({z1}{z2})")
+        if flags & SanmeiEngine.REL_GAI:
+            results.append(f"{pos}害({z1}{z2})")
+        return tuple(results)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def render_luck_relation(pos_name, flags):
+        # 運の干支と宿命の1柱との位相法の表示文字列 (例: "東方干合＋破")。該当なしは None
+        if flags & SanmeiEngine.REL_TENKOKU_CHICHU:
+            features = ["天剋地冲"]
+        else:
+            features = [name for bit, name in SanmeiEngine.LUCK_RELATION_NAMES if flags & bit]
+        if not features:
+            return None
+        return f"{pos_name}{'＋'.join(features)}"
 
-        # Generate all unique pairs of (name, gan, zhi)
-        pairs_to_check = []
-        for i in range(n):
-            for j in range(i + 1, n):
-                name1, g1, z1 = named_kanshi[i]
-                name2, g2, z2 = named_kanshi[j]
-                pairs_to_check.append((f"{name1}-{name2}", (g1, z1), (g2, z2)))
+    @staticmethod
+    def to_codes(kanshi_list):
+        # [(干, 支), ...] -> 干支コードのリスト (文字を受け取る公開メソッドの入口)
+        return [Kanshi.kanshi_code(Kanshi.GAN_INDEX[g], Kanshi.ZHI_INDEX[z]) for g, z in kanshi_list]
 
-        for name_pair, (g1, z1), (g2, z2) in pairs_to_check:
-            current_pair_results = []
-            
-            # 方位ラベルの決定
-            if name_pair == "年-月": pos = "東方"
-            elif name_pair == "月-日": pos = "中央"
-            else: pos = "西方"
-            
-            sorted_zhi_pair = tuple(sorted([z1, z2]))
-
-            # 支合 (Shigo)
-            shigo = {("丑", "子"), ("寅", "亥"), ("卯", "戌"), ("辰", "酉"), ("巳", "申"), ("午", "未")}
-            if sorted_zhi_pair in shigo:
-                current_pair_results.append(f"{pos}支合({z1}{z2})")
-
-            # 対冲 (Taichu)
-            taichu = {("子", "午"), ("丑", "未"), ("寅", "申"), ("卯", "酉"), ("辰", "戌"), ("巳", "亥")}
-            if sorted_zhi_pair in taichu:
-                current_pair_results.append(f"{pos}対冲({z1}{z2})")
-
-            # 半会・三合 (Hankai / San-go) - 異なる地支間のみ
-            if z1 != z2:
-                san_triplets = [("申", "子", "辰"), ("亥", "卯", "未"), ("寅", "午", "戌"), ("巳", "酉", "丑")]
-                is_daihankai = False
-                for t in san_triplets:
-                    if z1 in t and z2 in t:
-                        if g1 == g2:
-                            current_pair_results.append(f"{pos}大半会({z1}{z2})")
-                            is_daihankai = True
-                        if not is_daihankai:
-                            current_pair_results.append(f"{pos}半会({z1}{z2})")
-            
-            # 害 (Harm)
-            harms = {("子", "未"), ("丑", "午"), ("寅", "巳"), ("卯", "辰"), ("申", "亥"), ("酉", "戌")}
-            if sorted_zhi_pair in harms:
-                current_pair_results.append(f"{pos}害({z1}{z2})")
-            
-            results.extend(current_pair_results)
+    @staticmethod
+    def get_isouhou(kanshi_list): # Changed input to kanshi_list for gan access
+        return SanmeiEngine.get_isouhou_codes(SanmeiEngine.to_codes(kanshi_list))
 
-        return sorted(list(set(results)))
+    @staticmethod
+    def get_isouhou_codes(codes):
+        # 年-月: 東方, 月-日: 中央, 年-日: 西方
+        results = []
+        for i, j, pos in ((0, 1, "東方"), (1, 2, "中央"), (0, 2, "西方")):
+            flags = SanmeiEngine.RELATION_TABLE[codes[i] * 60 + codes[j]]
+            z1, z2 = Kanshi.DI_ZHI[codes[i] % 12], Kanshi.DI_ZHI[codes[j] % 12]
+            results.extend(SanmeiEngine.render_natal_relation(pos, z1, z2, flags))
+        return sorted(set(results))
 
     @staticmethod
     def calculate_suurihou_and_energy(kanshi_list):
-        # 命式内のすべての干(天干+全蔵干)をリスト化
-        all_stems = []
-        for g, z in kanshi_list:
-            all_stems.append(g) # 天干
-            for gan, days in SanmeiEngine.ZOKAN_TABLE[z]:
-                all_stems.append(gan) # 蔵干
-        
-        zhi_list = [z for g, z in kanshi_list] # 年・月・日の地支
-        
-        energy_by_wx = {"木": 0, "火": 0, "土": 0, "金": 0, "水": 0}
-        energy_by_stem = {g: 0 for g in Kanshi.TIAN_GAN}
-        total_energy = 0
-        
-        # 各干について、全地支(3つ)からのエネルギー合計値を算出
-        # 重複する干もそれぞれカウントする(例: 乙が4つあれば、乙の合計スコア * 4 となる)
-        for gan in all_stems:
-            stem_energy = 0
-            for zhi in zhi_list:
-                star = SanmeiEngine.get_junidai_jusei(gan, zhi)
-                score = SanmeiEngine.JUNIDAI_JUSEI_SCORE.get(star, 0)
-                stem_energy += score
-            
-            gan_wx = Kanshi.WU_XING[gan]
-            energy_by_stem[gan] += stem_energy
-            energy_by_wx[gan_wx] += stem_energy
-            total_energy += stem_energy
-                
-        return total_energy, energy_by_wx, energy_by_stem
-
+        # (総エネルギー, 五行分布, 十干内訳) の dict 版 (算出は EnergyProfile)
+        profile = EnergyProfile.from_kanshi_list(kanshi_list)
+        return profile.total, profile.wx_dict(), profile.stem_dict()
 
     @staticmethod
     def get_ijou_kanshi(kanshi_list):
+        return SanmeiEngine.get_ijou_kanshi_codes(SanmeiEngine.to_codes(kanshi_list))
+
+    @staticmethod
+    def get_ijou_kanshi_codes(codes):
         results = []
         labels = ["年", "月", "日"]
-        for i, (g, z) in enumerate(kanshi_list):
-            k_id = Kanshi.get_kanshi_id(g, z)
-            if k_id in SanmeiEngine.NORMAL_IJOU_KANSHI:
-                results.append(f"{labels[i]}柱: {g}{z} (通常異常干支)")
-            elif k_id in SanmeiEngine.ANGO_IJOU_KANSHI:
-                results.append(f"{labels[i]}柱: {g}{z} (暗合異常干支)")
+        for i, code in enumerate(codes):
+            ijou_type = SanmeiEngine.IJOU_KANSHI_TYPE[code]
+            if ijou_type:
+                results.append(f"{labels[i]}柱: {Kanshi.KANSHI_NAME[code]} ({ijou_type})")
         return results
 
     def get_shukumei_tenchusatsu(self):
         results = []
+        year_code, _, day_code = self.kanshi_codes
         # 日干支から導かれる天中殺 (身弱・身強の判定基準ではない)
-        nikkan_tenchu = self.get_tenchusatsu(self.nikkan, self.nishi)
+        nikkan_tenchu = SanmeiEngine.TENCHUSATSU_ZHI_MASK[day_code // 10]
         # 年干支から導かれる天中殺
-        nenkan_tenchu = self.get_tenchusatsu(self.nenkan, self.neshi)
+        nenkan_tenchu = SanmeiEngine.TENCHUSATSU_ZHI_MASK[year_code // 10]
 
-        is_seinen = any(z in nikkan_tenchu for z in self.neshi)
-        is_seigetsu = any(z in nikkan_tenchu for z in self.geshi)
-        is_seijitsu = any(z in nenkan_tenchu for z in self.nishi)
+        is_seinen = bool(nikkan_tenchu >> (year_code % 12) & 1)
+        is_seigetsu = bool(nikkan_tenchu >> (self.month_code % 12) & 1)
+        is_seijitsu = bool(nenkan_tenchu >> (day_code % 12) & 1)
 
         if is_seinen: results.append("生年中殺")
         if is_seigetsu: results.append("生月中殺")
@@ -348,385 +431,336 @@ class SanmeiEngine:
         if is_seinen and is_seijitsu: results.append("互換中殺")
         
         # 日座中殺 (甲戌, 乙亥)
-        nikkan_id = Kanshi.get_kanshi_id(self.nikkan, self.nishi)
-        if nikkan_id in [11, 12]:
+        if day_code in (10, 11):
             results.append("日座中殺")
         
         # 日居中殺 (甲辰, 乙巳)
-        if nikkan_id in [41, 42]:
+        if day_code in (40, 41):
             results.append("日居中殺")
 
         return list(set(results))
 
+    # 八門法: 日干の五行を中央とし、そこからの五行関係で配置
+    # 資料に基づく固定配置と相生相剋マッピング (方位, 日干の五行番号からのずれ)
+    # 中央: 比劫 (自分) / 北: 印星 / 南: 食傷 / 西: 官星 / 東: 財星
+    # 注: 西と東が流派により反転すること、資料の視覚配置を優先
+    HACHIMON_GATES = [
+        ("中央(自分/比劫)", 0),
+        ("北方(親・目上/習得)", -1),
+        ("南方(子供・目下/伝達)", 1),
+        ("西方(仕事・社会/名誉)", -2), # 官星
+        ("東方(家庭・配偶者/蓄積)", 2)  # 財星
+    ]
+
     @staticmethod
     def get_hachimonhou_formatted(nikkan, energy_by_wx):
-        # 八門法: 日干の五行を中央とし、そこからの五行関係で配置
-        nikkan_wx = Kanshi.WU_XING[nikkan]
-        order = ["木", "火", "土", "金", "水"]
-        idx = order.index(nikkan_wx)
-        
-        # 資料に基づく固定配置と相生相剋マッピング
-        wx_order = ["木", "火", "土", "金", "水"]
-        idx = wx_order.index(Kanshi.WU_XING[nikkan])
-        
-        # 中央: 比劫 (自分) / 北: 印星 / 南: 食傷 / 西: 官星 / 東: 財星
-        # 注: 西と東が流派により反転すること、資料の視覚配置を優先
-        return {
-            "中央(自分/比劫)": energy_by_wx[wx_order[idx]],
-            "北方(親・目上/習得)": energy_by_wx[wx_order[(idx - 1) % 5]],
-            "南方(子供・目下/伝達)": energy_by_wx[wx_order[(idx + 1) % 5]],
-            "西方(仕事・社会/名誉)": energy_by_wx[wx_order[(idx - 2) % 5]], # 官星
-            "東方(家庭・配偶者/蓄積)": energy_by_wx[wx_order[(idx + 2) % 5]]  # 財星
-        }
+        by_wx = [energy_by_wx[wx] for wx in Kanshi.WU_XING_ORDER]
+        return SanmeiEngine.get_hachimonhou(Kanshi.WU_XING_INDEX[nikkan], by_wx)
+
+    @staticmethod
+    def get_hachimonhou(day_wx, by_wx):
+        # day_wx: 日干の五行番号、by_wx: 五行分布 (WU_XING_ORDER 順)
+        return {gate: by_wx[(day_wx + offset) % 5] for gate, offset in SanmeiEngine.HACHIMON_GATES}
 
-    def __init__(self, year, month, day, hour=0, minute=0):
+    @classmethod
+    def batch(cls, dates, genders="M"):
+        # 大量の生年月日を NumPy 配列で一括計算する (詳細は sanmei_batch.compute_batch)
+        from sanmei_batch import compute_batch
+        return compute_batch(dates, genders)
+
+    def __init__(self, year, month, day, hour=None, minute=None):
         self.year = year
         self.month = month
         self.day = day
-        self.birth_dt = datetime.datetime(year, month, day, hour, minute)
+        # hour/minute は節入り日当日の月・年の境界判定にのみ使う (不明なら None)
+        self.hour = hour
+        self.minute = minute
+        # 入力の検証は datetime に任せ、以降の日付計算は通日 (整数) で行う
+        self.birth_ordinal = datetime.date(year, month, day).toordinal()
+        datetime.time(hour or 0, minute or 0)
         
         # --- Phase 1: 陰占 (命式) の算出 ---
         
-        # 1. 日干支の算出 (1900/1/1 = 甲戌(11) を基準)
-        base_dt = datetime.datetime(1900, 1, 1)
-        diff_days = (self.birth_dt.date() - base_dt.date()).days
-        nikkan_id = (diff_days + 11 - 1) % 60 + 1
-        self.nikkan = Kanshi.TIAN_GAN[(nikkan_id-1)%10]
-        self.nishi = Kanshi.DI_ZHI[(nikkan_id-1)%12]
+        # 1. 日干支の算出 (1900/1/1 = 甲戌 を基準)
+        day_code = (self.birth_ordinal - SanmeiEngine.EPOCH_ORDINAL + SanmeiEngine.EPOCH_DAY_CODE) % 60
         
         # 2. 年干支の算出 (2月の節入り=立春が年の境)
-        setsu_feb = self.get_setsuiri_day(year, 2)
         y_for_nen = year
-        if month < 2 or (month == 2 and day < setsu_feb):
+        if month < 2 or (month == 2 and self.is_before_setsuiri(year, 2, day, hour, minute)):
             y_for_nen -= 1
         
-        # 1900年 = 庚子(37)
-        nenkan_id = (y_for_nen - 1900 + 37 - 1) % 60 + 1
-        self.nenkan = Kanshi.TIAN_GAN[(nenkan_id-1)%10]
-        self.neshi = Kanshi.DI_ZHI[(nenkan_id-1)%12]
+        # 1900年 = 庚子
+        year_code = (y_for_nen - SanmeiEngine.EPOCH_YEAR + SanmeiEngine.EPOCH_YEAR_CODE) % 60
         
         # 3. 月干支の算出 (毎月の節入りが月の境)
         setsu_this_month = self.get_setsuiri_day(year, month)
+        before_setsu = self.is_before_setsuiri(year, month, day, hour, minute)
         m_idx = month # 1月=丑(1), 2月=寅(2)...
-        if day < setsu_this_month:
+        if before_setsu:
             m_idx -= 1
         
-        # 月支
-        self.geshi = Kanshi.DI_ZHI[m_idx % 12] # 2月=寅(2), 3月=卯(3)
-        
-        # 月干 (年上起月法)
-        # 甲・己年 -> 丙寅(3)から、乙・庚年 -> 戊寅(15)から...
-        start_gan_map = {"甲": 2, "己": 2, "乙": 4, "庚": 4, "丙": 6, "辛": 6, "丁": 8, "壬": 8, "戊": 0, "癸": 0}
-        start_gan_idx = start_gan_map[self.nenkan]
-        # 節月ベースのオフセット (寅月=0, 卯月=1...)
-        m_offset = (m_idx - 2) % 12
-        self.gekkan = Kanshi.TIAN_GAN[(start_gan_idx + m_offset) % 10]
+        month_code = self.get_month_code(year_code, m_idx)
+
+        # 宿命の干支コード (年, 月, 日)
+        self.kanshi_codes = (year_code, month_code, day_code)
+        self.year_code = year_code
+        self.month_code = month_code
+        self.day_code = day_code
+        self.day_gan = day_code % 10
+
+        # 数理法の計算結果 (energy プロパティで初回のみ算出)
+        self._energy = None
+        # 干支コード -> 運の詳細 (get_kanshi_details で初回のみ算出)
+        self._details_table = [None] * 60
 
         # 蔵干計算用の節日数 (Phase 2の準備)
-        self.setsunissu = (day - setsu_this_month) % 30 + 1
+        # (節入り日当日でも時刻が節入り前なら前月の最終日扱い)
+        day_offset = day - setsu_this_month
+        if before_setsu and day_offset == 0:
+            day_offset = -1
+        self.setsunissu = day_offset % 30 + 1
 
+    # 陰占の干・支の文字 (出力・文字を受け取る公開メソッド用)
+    @property
+    def nenkan(self):
+        return Kanshi.TIAN_GAN[self.year_code % 10]
 
-    def calculate_daiun(self, gender):
-        # 順行・逆行判定
-        nen_yinyang = Kanshi.YIN_YANG[self.nenkan]
-        is_shunko = (gender == "M" and nen_yinyang == "+") or (gender == "F" and nen_yinyang == "-")
-        
-        # 立運算出
-        y, m, d = self.birth_dt.year, self.birth_dt.month, self.birth_dt.day
-        if is_shunko:
-            next_m = m + 1
-            next_y = y
-            if next_m > 12: next_m = 1; next_y += 1
-            setsu_day = self.get_setsuiri_day(next_y, next_m)
-            days_diff = (datetime.date(next_y, next_m, setsu_day) - self.birth_dt.date()).days
-        else:
-            setsu_day = self.get_setsuiri_day(y, m)
-            days_diff = (self.birth_dt.date() - datetime.date(y, m, setsu_day)).days
-            
-        ritsuen = int(days_diff / 3)
-        rem = days_diff % 3
-        if rem == 2: ritsuen += 1
-        if ritsuen == 0: ritsuen = 1
-        
-        # サイクル生成
-        gekkan_id = Kanshi.get_kanshi_id(self.gekkan, self.geshi)
-        daiun_list = []
-        
-        # 宿命の干支（位相法・干合判定用）
-        natal_kanshi_list = [("東方", self.nenkan, self.neshi), ("中央", self.gekkan, self.geshi), ("西方", self.nikkan, self.nishi)]
+    @property
+    def neshi(self):
+        return Kanshi.DI_ZHI[self.year_code % 12]
 
-    def _get_kanshi_details(self, gan, zhi):
-        # 星の算出
-        judai = SanmeiEngine.get_judai_shusei(self.nikkan, gan)
-        junidai = SanmeiEngine.get_junidai_jusei(self.nikkan, zhi)
-        
-        # 位相法 (方位別)
-        # 定義：各ペアをソート済みのタプルとして保持するセット
-        SHIGO_PAIRS = {tuple(sorted(p)) for p in [("丑", "子"), ("寅", "亥"), ("卯", "戌"), ("辰", "酉"), ("巳", "申"), ("午", "未")]}
-        TAICHU_PAIRS = {tuple(sorted(p)) for p in [("子", "午"), ("丑", "未"), ("寅", "申"), ("卯", "酉"), ("辰", "戌"), ("巳", "亥")]}
-        GAI_PAIRS = {tuple(sorted(p)) for p in [("子", "未"), ("丑", "午"), ("寅", "巳"), ("卯", "辰"), ("申", "亥"), ("酉", "戌")]}
-        
-        # 破 (Ha)
-        HA_PAIRS = {tuple(sorted(p)) for p in [("子", "酉"), ("丑", "辰"), ("寅", "亥"), ("卯", "午"), ("巳", "申"), ("未", "戌")]}
-        
-        # 刑 (Kei)
-        KEI_OUKI = {tuple(sorted(p)) for p in [("子", "卯")]}
-        KEI_SEIKI = {tuple(sorted(p)) for p in [("寅", "巳"), ("巳", "申"), ("申", "寅")]}
-        KEI_KOKI = {tuple(sorted(p)) for p in [("丑", "戌"), ("戌", "未"), ("未", "丑")]}
-        
-        # 干合 (Kangou)
-        KANGOU_PAIRS = {tuple(sorted(p)) for p in [("甲", "己"), ("乙", "庚"), ("丙", "辛"), ("丁", "壬"), ("戊", "癸")]}
+    @property
+    def gekkan(self):
+        return Kanshi.TIAN_GAN[self.month_code % 10]
 
-        HANKAI_TRIPLETS = [("申", "子", "辰"), ("亥", "卯", "未"), ("寅", "午", "戌"), ("巳", "酉", "丑")]
+    @property
+    def geshi(self):
+        return Kanshi.DI_ZHI[self.month_code % 12]
 
-        isouhou_details = []
-        # 宿命の干支（位相法・干合判定用） - get this from self context again or pass logic?
-        # self is available here.
-        natal_kanshi_list = [("東方", self.nenkan, self.neshi), ("中央", self.gekkan, self.geshi), ("西方", self.nikkan, self.nishi)]
-        
-        for pos_name, n_gan, n_zhi in natal_kanshi_list:
-            z_pair = tuple(sorted([n_zhi, zhi]))
-            g_pair = tuple(sorted([n_gan, gan]))
-            
-            features = []
-            
-            # 天剋地冲 Check (天干が相剋かつ地支が対冲)
-            # 相剋: 木剋土, 土剋水, 水剋火, 火剋金, 金剋木. 
-            # 干の番号差が 4 or 6 (例: 甲(0) vs 戊(4) -> 木剋土, 甲(0) vs 庚(6) -> 金剋木)
-            n_g_idx = Kanshi.TIAN_GAN.index(n_gan)
-            d_g_idx = Kanshi.TIAN_GAN.index(gan)
-            g_diff = abs(n_g_idx - d_g_idx)
-            is_tenkoku = (g_diff == 4 or g_diff == 6)
-            if is_tenkoku and (z_pair in TAICHU_PAIRS):
-                features.append("天剋地冲")
-            else:
-                # 天剋地冲でなければ個別に判定
-                
-                # 干合
-                if g_pair in KANGOU_PAIRS:
-                    features.append("干合")
-
-                # 支合
-                if z_pair in SHIGO_PAIRS:
-                    features.append("支合")
-                
-                # 対冲
-                if z_pair in TAICHU_PAIRS:
-                    features.append("対冲")
-                
-                # 害
-                if z_pair in GAI_PAIRS:
-                    features.append("害")
-                
-                # 破
-                if z_pair in HA_PAIRS:
-                    features.append("破")
-                
-                # 刑
-                if n_zhi == zhi and n_zhi in ["辰", "午", "酉", "亥"]:
-                    features.append("自刑")
-                if z_pair in KEI_OUKI:
-                    features.append("旺気刑")
-                if z_pair in KEI_SEIKI:
-                    features.append("生貴刑")
-                if z_pair in KEI_KOKI:
-                    features.append("庫気刑")
-                
-                # 半会 (異地支)
-                if n_zhi != zhi:
-                    for t in HANKAI_TRIPLETS:
-                        if n_zhi in t and zhi in t:
-                            features.append("半会")
-
-                # 比和 (同じ五行)
-                n_wx = Kanshi.WU_XING[SanmeiEngine.DI_ZHI_TO_GAN_MAP[n_zhi]]
-                z_wx = Kanshi.WU_XING[SanmeiEngine.DI_ZHI_TO_GAN_MAP[zhi]]
-                if n_wx == z_wx:
-                    # 他の強い条件(支合・対冲・害・刑・半会)がない場合のみ比和を表示するのが一般的だが
-                    # PDFでは自刑と併記されている。ただし「半会」などがある場合に比和を出すかは流派による。
-                    # SanmeiAppは「洩天地比」を出している。これは干合＋支合＋比和のような強い結合。
-                    # 今回はシンプルに「比和」を追加する。
-                    features.append("比和")
-            
-            if features:
-                isouhou_details.append(f"{pos_name}{'＋'.join(features)}")
-        
-        return isouhou_details, judai, junidai
-        
-        return isouhou_details, judai, junidai
+    @property
+    def nikkan(self):
+        return Kanshi.TIAN_GAN[self.day_gan]
+
+    @property
+    def nishi(self):
+        return Kanshi.DI_ZHI[self.day_code % 12]
 
-    def calculate_daiun(self, gender):
-        # 順行・逆行判定
-        nen_yinyang = Kanshi.YIN_YANG[self.nenkan]
-        is_shunko = (gender == "M" and nen_yinyang == "+") or (gender == "F" and nen_yinyang == "-")
+    def get_chart_relation_flags(self, code):
+        # 宿命 (年・月・日) の各柱と運の干支 (干支コード) との位相法フラグ
+        table = SanmeiEngine.RELATION_TABLE
+        return tuple(table[c * 60 + code] for c in self.kanshi_codes)
+
+    def get_kanshi_details(self, code):
+        # 運の干支の詳細 (位相法・十大主星・十二大従星・天中殺) は宿命と干支だけで決まる。
+        # 60干支ぶんを命式ごとに一度だけ算出し、年運・大運の各行はここから引く
+        row = self._details_table[code]
+        if row is None:
+            gan, zhi = code % 10, code % 12
+            # 位相法 (方位別): 宿命の各柱と運の干支の関係は RELATION_TABLE を1回引くだけ
+            isouhou_details = []
+            for pos_name, flags in zip(("東方", "中央", "西方"), self.get_chart_relation_flags(code)):
+                rendered = SanmeiEngine.render_luck_relation(pos_name, flags)
+                if rendered:
+                    isouhou_details.append(rendered)
+            tenchu_mask = SanmeiEngine.TENCHUSATSU_ZHI_MASK[self.day_code // 10]
+            row = (
+                Kanshi.KANSHI_NAME[code],
+                SanmeiEngine.JUDAI_SHUSEI_MATRIX[self.day_gan][gan],
+                SanmeiEngine.JUNIDAI_JUSEI_MATRIX[self.day_gan][zhi],
+                tuple(isouhou_details),
+                "天中殺" if tenchu_mask >> zhi & 1 else "",
+            )
+            self._details_table[code] = row
+        return row
+
+    def get_daiun_direction(self, gender):
+        # (順行かどうか, 立運)
+        # 順行・逆行判定 (年干の陰陽: 0=陽, 1=陰)
+        nen_yang = Kanshi.GAN_YY[self.year_code % 10] == 0
+        is_shunko = (gender == "M" and nen_yang) or (gender == "F" and not nen_yang)
         
         # 立運算出
-        y, m, d = self.birth_dt.year, self.birth_dt.month, self.birth_dt.day
+        y, m = self.year, self.month
         if is_shunko:
             next_m = m + 1
             next_y = y
             if next_m > 12: next_m = 1; next_y += 1
             setsu_day = self.get_setsuiri_day(next_y, next_m)
-            days_diff = (datetime.date(next_y, next_m, setsu_day) - self.birth_dt.date()).days
+            days_diff = SanmeiEngine.to_ordinal(next_y, next_m, setsu_day) - self.birth_ordinal
         else:
             setsu_day = self.get_setsuiri_day(y, m)
-            days_diff = (self.birth_dt.date() - datetime.date(y, m, setsu_day)).days
+            days_diff = self.birth_ordinal - SanmeiEngine.to_ordinal(y, m, setsu_day)
             
         ritsuen = int(days_diff / 3)
         rem = days_diff % 3
         if rem == 2: ritsuen += 1
         if ritsuen == 0: ritsuen = 1
+        return is_shunko, ritsuen
+
+    def get_daiun(self, gender, cycles=range(1, 11)):
+        # cycles: 第何運を算出するか (既定は 1〜10 = 100歳まで)
+        is_shunko, ritsuen = self.get_daiun_direction(gender)
         
-        # サイクル生成
-        gekkan_id = Kanshi.get_kanshi_id(self.gekkan, self.geshi)
-        daiun_list = []
-        
-        # 天中殺グループ（日干由来）
-        nikkan_tenchu = self.get_tenchusatsu(self.nikkan, self.nishi)
-        
-        for i in range(1, 11): # 100歳まで
+        # サイクル生成 (月干支から順行は +1、逆行は -1 ずつ)
+        pillars = []
+        for i in cycles:
             offset = i if is_shunko else -i
-            k_id = (gekkan_id + offset - 1) % 60 + 1
-            gan = Kanshi.TIAN_GAN[(k_id-1)%10]
-            zhi = Kanshi.DI_ZHI[(k_id-1)%12]
-            
             age_start = ritsuen + (i-1)*10
-            start_year = self.year + age_start
-            
-            # 詳細算出 (共通メソッド)
-            isouhou_details, judai, junidai = self._get_kanshi_details(gan, zhi)
+            pillars.append(LuckPillar(self, (self.month_code + offset) % 60, self.year + age_start, age_start))
+        return Daiun(ritsuen, is_shunko, pillars)
 
-            # 天中殺
-            tenchu_str = "天中殺" if zhi in nikkan_tenchu else ""
-            
-            daiun_list.append({
-                "年齢": age_start,
-                "西暦": start_year,
-                "干支": gan + zhi,
-                "十大主星": judai,
-                "十二大従星": junidai,
-                "位相法": isouhou_details,
-                "天中殺": tenchu_str
-            })
-            
-        return {
-            "立運": ritsuen,
-            "方向": "順行" if is_shunko else "逆行",
-            "サイクル": daiun_list
-        }
+    def calculate_daiun(self, gender, cycles=range(1, 11)):
+        return self.get_daiun(gender, cycles).to_dict()
 
-    def calculate_nenun(self, start_year, duration=100):
-        nenun_list = []
-        nikkan_tenchu = self.get_tenchusatsu(self.nikkan, self.nishi)
-        
+    def get_daiun_cycles_between(self, gender, from_year, to_year):
+        # [from_year, to_year] と重なる大運の番号 (1始まり)
+        _, ritsuen = self.get_daiun_direction(gender)
+        first_start = self.year + ritsuen
+        first = max(1, (from_year - first_start) // 10 + 1)
+        last = (to_year - first_start) // 10 + 1
+        return range(first, max(first, last + 1))
+
+    def get_nenun(self, start_year, duration=100):
         # 節分(2/4頃)を基準に年が切り替わるが、単純な干支計算には (year-4)%60+1 を使用
         # ただし算命学の年運は立春(2/4)で切り替わる。
         # ここでは一覧として、指定された西暦に対応する干支を表示する。
         # ユーザーが「西暦」で見る場合、通常はその年の立春以降の干支を指す。
+        # 年齢は満年齢(簡単な計算): その年に到達する年齢
         
-        for i in range(duration):
-            target_year = start_year + i
-            age = target_year - self.year # 満年齢(簡単な計算) or 数え年？ 大運は満年齢ベースが多いが、年運は誕生日切り替えか立春切り替えか。
-                                        # 大運表の年齢に合わせるなら、その年に到達する年齢。
-            
-            # 年干支ID算出: 1984年が甲子(1)
-            # offset from 1984
-            diff = target_year - 1984
-            k_id = (0 + diff) % 60 + 1 # 1984 is 1 (0-based idx 0) + diff
-            if k_id <= 0: k_id += 60 # Handle negative diff correctly
-            
-            gan = Kanshi.TIAN_GAN[(k_id-1)%10]
-            zhi = Kanshi.DI_ZHI[(k_id-1)%12]
-            
-            # 詳細算出
-            isouhou_details, judai, junidai = self._get_kanshi_details(gan, zhi)
-            
-            tenchu_str = "天中殺" if zhi in nikkan_tenchu else ""
-            
-            nenun_list.append({
-                "西暦": target_year,
+        # 年干支コード算出: 1984年が甲子(0)
+        return [
+            NenunPillar(self, (target_year - SanmeiEngine.NENUN_BASE_YEAR) % 60, target_year, target_year - self.year)
+            for target_year in range(start_year, start_year + duration)
+        ]
+
+    def calculate_nenun(self, start_year, duration=100):
+        return [p.to_dict() for p in self.get_nenun(start_year, duration)]
+
+    def get_energy_timeline(self, gender, from_year, to_year):
+        # 宿命 + その年の大運 + 年運 の数理法を [from_year, to_year] の各年について
+        # NumPy 配列で一括計算する (詳細は sanmei_batch.compute_energy_timeline)
+        from sanmei_batch import compute_energy_timeline
+        return compute_energy_timeline(self, gender, from_year, to_year)
+
+    def calculate_energy_timeline(self, gender, from_year, to_year):
+        timeline = self.get_energy_timeline(gender, from_year, to_year)
+        gates = [gate for gate, _ in SanmeiEngine.HACHIMON_GATES]
+        rows = []
+        for year, age, daiun_code, nenun_code, total, by_wx, hachimon in zip(
+            timeline["year"].tolist(), timeline["age"].tolist(),
+            timeline["daiun_code"].tolist(), timeline["nenun_code"].tolist(),
+            timeline["total_energy"].tolist(), timeline["energy_by_wx"].tolist(), timeline["hachimon"].tolist(),
+        ):
+            rows.append({
+                "西暦": year,
                 "年齢": age,
-                "干支": gan + zhi,
-                "十大主星": judai,
-                "十二大従星": junidai,
-                "位相法": isouhou_details,
-                "天中殺": tenchu_str
+                "大運": Kanshi.KANSHI_NAME[daiun_code] if daiun_code >= 0 else None,
+                "年運": Kanshi.KANSHI_NAME[nenun_code],
+                "総エネルギー": total,
+                "五行分布": dict(zip(Kanshi.WU_XING_ORDER, by_wx)),
+                "八門法": dict(zip(gates, hachimon)),
             })
-            
-        return nenun_list
+        return rows
+
+    def get_full_report(self, gender="M", sections=None, nenun_range=None):
+        # sections: 算出する項目 (REPORT_SECTIONS の部分集合, None なら全項目)
+        # nenun_range: 年運の (開始年, 終了年) ※終了年は含まない。None なら生年から100年
+        if sections is None:
+            sections = SanmeiEngine.REPORT_SECTIONS
+        daiun = self.get_daiun(gender).to_dict() if "大運" in sections else None
+        return self.merge_report(self.get_natal_report(sections, nenun_range), daiun)
 
+    @staticmethod
+    def merge_report(natal_report, daiun):
+        # 性別に依存しない部分と大運を REPORT_SECTIONS の順に組み立てる
+        report = {}
+        for section in SanmeiEngine.REPORT_SECTIONS:
+            if section == "大運":
+                if daiun is not None:
+                    report[section] = daiun
+            elif section in natal_report:
+                report[section] = natal_report[section]
+        return report
 
+    def get_natal_chart(self, nenun_range=None):
+        # 大運 (性別に依存) 以外の結果。nenun_range: 年運の (開始年, 終了年)。None なら生年から100年
+        return NatalChart(self, nenun_range)
 
-    def get_full_report(self, gender="M"):
-        # 節入りからの日数 (Phase 1で算出済み)
-        setsunissu = self.setsunissu
-        
-        # 陰占表示用の「動的な」蔵干特定 (遷移表示に使用)
-        z_nen = self.get_zokan(self.neshi, setsunissu)
-        z_getsu = self.get_zokan(self.geshi, setsunissu)
-        z_nichi = self.get_zokan(self.nishi, setsunissu)
-        
-        # 陽占用の蔵干特定 (人体星図の主星は各支の「本元」を使用)
-        bg_nen = SanmeiEngine.ZOKAN_TABLE[self.neshi][-1][0]
-        bg_getsu = SanmeiEngine.ZOKAN_TABLE[self.geshi][-1][0]
-        bg_nishi = SanmeiEngine.ZOKAN_TABLE[self.nishi][-1][0]
-        
-        kanshi_list = [(self.nenkan, self.neshi), (self.gekkan, self.geshi), (self.nikkan, self.nishi)]
-        
+    def get_natal_report(self, sections=None, nenun_range=None):
+        # 大運 (性別に依存) 以外のレポート。男女で共有でき、要求された項目だけを算出する
+        return self.get_natal_chart(nenun_range).to_dict(sections)
+
+    @property
+    def kanshi_list(self):
+        return [(self.nenkan, self.neshi), (self.gekkan, self.geshi), (self.nikkan, self.nishi)]
+
+    @property
+    def zokan_codes(self):
+        # 「動的な」蔵干特定 (節入りからの日数に基づく, 年・月・日) の干コード
+        by_day = SanmeiEngine.ZOKAN_BY_DAY
+        return tuple(by_day[c % 12][self.setsunissu] for c in self.kanshi_codes)
+
+    @property
+    def zokan(self):
+        # 陰占表示用の動的蔵干 (文字)
+        return tuple(Kanshi.TIAN_GAN[g] for g in self.zokan_codes)
+
+    @property
+    def energy(self):
+        # 数理法 (全蔵干を考慮) の EnergyProfile。数理法と八門法で共有する
+        if self._energy is None:
+            self._energy = EnergyProfile.from_codes(self.kanshi_codes)
+        return self._energy
+
+    def _report_insen(self):
+        z_nen, z_getsu, z_nichi = self.zokan
+        # 蔵干の詳細 (資料の遷移表示用)
+        nen, getsu, nichi = (
+            f"{Kanshi.DI_ZHI[c % 12]}: {' '.join(Kanshi.TIAN_GAN[g] for g in SanmeiEngine.ZOKAN_STEMS[c % 12])}"
+            for c in self.kanshi_codes
+        )
+        zokan_details = {"年": nen, "月": getsu, "日": nichi, "遷移": f"> {z_nichi} > {z_getsu} > {z_nen}"}
+        year_code, month_code, day_code = self.kanshi_codes
+        return {
+            "年": f"({year_code + 1}) {Kanshi.KANSHI_NAME[year_code]}", 
+            "月": f"({month_code + 1}) {Kanshi.KANSHI_NAME[month_code]}", 
+            "日": f"({day_code + 1}) {Kanshi.KANSHI_NAME[day_code]}",
+            "蔵干": zokan_details
+        }
+
+    def _report_yousen(self):
+        z_nen, z_getsu, z_nichi = self.zokan_codes
         # 陽占 (人体星図) の算出 (節日数に基づく動的蔵干を使用)
+        judai_row = SanmeiEngine.JUDAI_SHUSEI_MATRIX[self.day_gan]
         judai = {
-            "頭": self.get_judai_shusei(self.nikkan, self.nenkan),
-            "胸": self.get_judai_shusei(self.nikkan, z_getsu),
-            "腹": self.get_judai_shusei(self.nikkan, self.gekkan),
-            "左手": self.get_judai_shusei(self.nikkan, z_nen),
-            "右手": self.get_judai_shusei(self.nikkan, z_nichi)
+            "頭": judai_row[self.year_code % 10],
+            "胸": judai_row[z_getsu],
+            "腹": judai_row[self.month_code % 10],
+            "左手": judai_row[z_nen],
+            "右手": judai_row[z_nichi]
         }
         # 十二大従星 (名称に「星」を付加)
+        junidai_row = SanmeiEngine.JUNIDAI_JUSEI_MATRIX[self.day_gan]
         junidai = {
-            "初年": self.get_junidai_jusei(self.nikkan, self.neshi) + "星",
-            "中年": self.get_junidai_jusei(self.nikkan, self.geshi) + "星",
-            "晩年": self.get_junidai_jusei(self.nikkan, self.nishi) + "星"
-        }
-        
-        # 数理法・八門法 (全蔵干を考慮)
-        total_energy, energy_by_wx, energy_by_stem = self.calculate_suurihou_and_energy(kanshi_list)
-        hachimon = self.get_hachimonhou_formatted(self.nikkan, energy_by_wx)
-        
-        # 蔵干の詳細 (資料の遷移表示用)
-        zokan_details = {
-            "年": f"{self.neshi}: {' '.join([g for g, d in SanmeiEngine.ZOKAN_TABLE[self.neshi] if g])}",
-            "月": f"{self.geshi}: {' '.join([g for g, d in SanmeiEngine.ZOKAN_TABLE[self.geshi] if g])}",
-            "日": f"{self.nishi}: {' '.join([g for g, d in SanmeiEngine.ZOKAN_TABLE[self.nishi] if g])}",
-            "遷移": f"> {z_nichi} > {z_getsu} > {z_nen}"
+            "初年": junidai_row[self.year_code % 12] + "星",
+            "中年": junidai_row[self.month_code % 12] + "星",
+            "晩年": junidai_row[self.day_code % 12] + "星"
         }
+        return {"十大主星": judai, "十二大従星": junidai}
 
-        # 運勢・その他
-        daiun = self.calculate_daiun(gender)
-        nenun = self.calculate_nenun(self.year, 100) # Added nenun calculation
-        uchu_ids = [Kanshi.get_kanshi_id(g, z) for g, z in kanshi_list]
-        tenchusatsu = self.get_tenchusatsu(self.nikkan, self.nishi)
-        shukumei_tenchu = self.get_shukumei_tenchusatsu()
-        ijou_kanshi = self.get_ijou_kanshi(kanshi_list)
-        isouhou = self.get_isouhou(kanshi_list)
-        
+    def _report_tenchusatsu(self):
         return {
-            "陰占": {
-                "年": f"({Kanshi.get_kanshi_id(self.nenkan, self.neshi)}) {self.nenkan}{self.neshi}", 
-                "月": f"({Kanshi.get_kanshi_id(self.gekkan, self.geshi)}) {self.gekkan}{self.geshi}", 
-                "日": f"({Kanshi.get_kanshi_id(self.nikkan, self.nishi)}) {self.nikkan}{self.nishi}",
-                "蔵干": zokan_details
-            },
-            "陽占": {"十大主星": judai, "十二大従星": junidai},
-            "天中殺": {"グループ": tenchusatsu, "宿命天中殺": shukumei_tenchu},
-            "異常干支": ijou_kanshi,
-            "位相法": isouhou,
-            "大運": daiun,
-            "年運": nenun, # Added nenun to the returned dictionary
-            "宇宙盤": {"干支番号": uchu_ids},
-            "数理法": {"総エネルギー": total_energy, "五行分布": energy_by_wx, "十干内訳": energy_by_stem},
-            "八門法": hachimon
+            "グループ": SanmeiEngine.TENCHUSATSU_BY_SHUN[self.day_code // 10],
+            "宿命天中殺": self.get_shukumei_tenchusatsu()
         }
 
+    def text_report_nenun_range(self, current_year=None):
+        # format_as_text_report が表示する年運 (現在年から直近20年) だけを含む範囲
+        if current_year is None:
+            current_year = datetime.datetime.now().year
+        start_year = max(self.year, current_year)
+        return (start_year, max(start_year, min(self.year + 100, current_year + SanmeiEngine.TEXT_REPORT_NENUN_YEARS)))
+
     def format_as_text_report(self, report):
         """
         レポート辞書を受け取り、main.pyの出力形式と同じテキストを生成して返す。
@@ -810,13 +844,13 @@ class SanmeiEngine:
 
         # 年運
         if "年運" in report:
-            lines.append("\n--- 年運 (直近20年) ---")
+            lines.append(f"\n--- 年運 (直近{SanmeiEngine.TEXT_REPORT_NENUN_YEARS}年) ---")
             lines.append(f" {'年齢':>3} {'(西暦)':>5} | {'干支':^4} | {'十大主星':^6} | {'十二大従星':^5} | {'位相法':<20} | {'天中殺':<5}")
             lines.append("-" * 75)
             
             current_year = datetime.datetime.now().year
             for data in report["年運"]:
-                if data["西暦"] >= current_year and data["西暦"] < current_year + 20:
+                if data["西暦"] >= current_year and data["西暦"] < current_year + SanmeiEngine.TEXT_REPORT_NENUN_YEARS:
                      isou_str = ", ".join(data["位相法"])
                      lines.append(f" {data['年齢']:>3} ({data['西暦']:>5}) | {data['干支']:^4} | {data['十大主星']:^6} | {data['十二大従星']:^6} | {isou_str:<20} | {data['天中殺']:<5}")
 
@@ -871,3 +905,414 @@ class SanmeiEngine:
         lines.append(f"      南方(伝達): {get_h_val('南方')}")
         
         return "\n".join(lines)
+
+    @staticmethod
+    def estimate_tokens(text):
+        wide = len(SanmeiEngine._WIDE_CHARS.findall(text))
+        return wide + (len(text) - wide + 3) // 4
+
+    @staticmethod
+    def format_as_prompt(report, years=None, budget=None, current_year=None):
+        """
+        レポート辞書を LLM に渡すためのコンパクトな表現 (key=value 行と CSV 形式の表) にする。
+        format_as_text_report と同じ内容を、桁揃えの空白・罫線・気図法/八門法の図なしで出力する。
+        年運は years の年 (省略時は現在年から PROMPT_NENUN_YEARS 年分) だけを載せる。
+        budget (推定トークン数) を超える場合は、年運→大運の順に現在年から遠い行から落とす。
+        戻り値: (テキスト, {"chars", "estimated_tokens", "nenun_years", "dropped_rows"})
+        """
+        if current_year is None:
+            current_year = datetime.datetime.now().year
+        if years is None:
+            years = range(current_year, current_year + SanmeiEngine.PROMPT_NENUN_YEARS)
+        years = set(years)
+
+        def kv(label, items):
+            return f"{label} " + " ".join(f"{k}={v}" for k, v in items)
+
+        def row(r, first):
+            return f"{r[first]},{r['西暦'] if first == '年齢' else r['年齢']},{r['干支']},{r['十大主星']},{r['十二大従星']},{'/'.join(r['位相法'])},{r['天中殺']}"
+
+        insen = report["陰占"]
+        zokan = insen["蔵干"]
+        junidai = []
+        for k in ["初年", "中年", "晩年"]:
+            v = report["陽占"]["十二大従星"].get(k)
+            if v and "(" not in v:
+                v = f"{v}{SanmeiEngine.JUNIDAI_JUSEI_KEYWORDS.get(v.replace('星', ''), '')}"
+            junidai.append((k, v))
+        tenchu = report["天中殺"]
+        energy = report["数理法"]
+
+        lines = [
+            kv("命式", [(k, insen[k]) for k in ["年", "月", "日"]]),
+            kv("蔵干", [(k, zokan[k].replace(" ", "")) for k in ["年", "月", "日"]] + [("遷移", zokan["遷移"].lstrip("> ").replace(" ", ""))]),
+            kv("十大主星", report["陽占"]["十大主星"].items()),
+            kv("十二大従星", junidai),
+            kv("天中殺", [("グループ", tenchu["グループ"]), ("宿命天中殺", "/".join(tenchu["宿命天中殺"]) or "なし")]),
+        ]
+        timing = tenchu.get("タイミング")
+        if timing:
+            timing_years = timing["years"] if isinstance(timing["years"], str) else "/".join(timing["years"])
+            lines.append(kv("天中殺時期", [("時間", timing["time"]), ("月", timing["month"]), ("年", timing_years)]))
+        lines += [
+            f"異常干支={'/'.join(report['異常干支']) or 'なし'}",
+            f"位相法={'/'.join(report['位相法']) or 'なし'}",
+            kv("数理法", [("総エネルギー", energy["総エネルギー"])] + list(energy["五行分布"].items())),
+            kv("十干内訳", energy["十干内訳"].items()),
+            kv("八門法", report["八門法"].items()),
+            kv("大運", [("立運", report["大運"]["立運"]), ("方向", report["大運"]["方向"])]),
+            "大運表(年齢,西暦,干支,十大主星,十二大従星,位相法,天中殺)",
+        ]
+        daiun_rows = list(report["大運"]["サイクル"])
+        nenun_rows = [r for r in report.get("年運", []) if r["西暦"] in years]
+
+        def render():
+            body = lines + [row(r, "年齢") for r in daiun_rows]
+            if nenun_rows:
+                body.append("年運表(西暦,年齢,干支,十大主星,十二大従星,位相法,天中殺)")
+                body += [row(r, "西暦") for r in nenun_rows]
+            return "\n".join(body)
+
+        text = render()
+        dropped = 0
+        if budget is not None:
+            # 現在年から遠い行を年運→大運の順に落とす (表の並びは西暦順のまま)
+            for rows in (nenun_rows, daiun_rows):
+                while rows and SanmeiEngine.estimate_tokens(text) > budget:
+                    rows.remove(max(rows, key=lambda r: abs(r["西暦"] + (5 if rows is daiun_rows else 0) - current_year)))
+                    dropped += 1
+                    text = render()
+
+        return text, {
+            "chars": len(text),
+            "estimated_tokens": SanmeiEngine.estimate_tokens(text),
+            "nenun_years": [r["西暦"] for r in nenun_rows],
+            "dropped_rows": dropped,
+        }
+
+
+# ============================================
+# 結果オブジェクト (__slots__ で整数コードだけを保持)
+# ============================================
+# 文字列や dict は to_dict() で出力するときにだけ作る。to_dict() の形は
+# get_full_report / calculate_daiun / calculate_nenun が返す dict と同じ。
+# 運の行の詳細 (干支名・星・位相法) は命式ごとにメモ化した get_kanshi_details から引く。
+
+class EnergyProfile:
+    # 数理法: 総エネルギー、五行分布 (WU_XING_ORDER 順)、十干内訳 (TIAN_GAN 順)
+    __slots__ = ("total", "by_wx", "by_stem")
+
+    def __init__(self, total, by_wx, by_stem):
+        self.total = total
+        self.by_wx = by_wx
+        self.by_stem = by_stem
+
+    @classmethod
+    def from_kanshi_list(cls, kanshi_list):
+        return cls.from_indices([(Kanshi.GAN_INDEX[g], Kanshi.ZHI_INDEX[z]) for g, z in kanshi_list])
+
+    @classmethod
+    def from_codes(cls, codes):
+        stem_count = [sum(col) for col in zip(*(SanmeiEngine.ENERGY_STEM_COUNT[c] for c in codes))]
+        branch_score = [sum(col) for col in zip(*(SanmeiEngine.ENERGY_BRANCH_SCORE[c % 12] for c in codes))]
+        return cls.from_vectors(stem_count, branch_score)
+
+    @classmethod
+    def from_indices(cls, pillars):
+        # pillars: [(干コード, 支コード), ...]
+        # 命式内のすべての干 (天干 + 全蔵干) について、年・月・日の地支からのスコアを合計する
+        # 重複する干もそれぞれカウントする (例: 乙が4つあれば、乙の合計スコア * 4 となる)
+        # = 干ごとの「個数 x 全地支からのスコア和」なので、柱ごとの増分を足し合わせてから掛ける
+        stem_count = [0] * 10
+        branch_score = [0] * 10
+        for g, z in pillars:
+            stem_count[g] += 1
+            for g_idx in SanmeiEngine.ZOKAN_STEMS[z]:
+                stem_count[g_idx] += 1
+            branch_score = [a + b for a, b in zip(branch_score, SanmeiEngine.ENERGY_BRANCH_SCORE[z])]
+        return cls.from_vectors(stem_count, branch_score)
+
+    @classmethod
+    def from_vectors(cls, stem_count, branch_score):
+        by_stem = [c * s for c, s in zip(stem_count, branch_score)]
+        by_wx = [0] * 5
+        for g_idx, value in enumerate(by_stem):
+            by_wx[Kanshi.GAN_WX[g_idx]] += value
+        return cls(sum(by_stem), tuple(by_wx), tuple(by_stem))
+
+    def wx_dict(self):
+        return dict(zip(Kanshi.WU_XING_ORDER, self.by_wx))
+
+    def stem_dict(self):
+        return dict(zip(Kanshi.TIAN_GAN, self.by_stem))
+
+    def to_dict(self):
+        return {"総エネルギー": self.total, "五行分布": self.wx_dict(), "十干内訳": self.stem_dict()}
+
+
+class LuckPillar:
+    # 大運の1行: 干支コード・西暦・年齢
+    __slots__ = ("engine", "code", "year", "age")
+
+    def __init__(self, engine, code, year, age):
+        self.engine = engine
+        self.code = code
+        self.year = year
+        self.age = age
+
+    def to_dict(self):
+        kanshi, judai, junidai, isouhou_details, tenchu_str = self.engine.get_kanshi_details(self.code)
+        return {
+            "年齢": self.age,
+            "西暦": self.year,
+            "干支": kanshi,
+            "十大主星": judai,
+            "十二大従星": junidai,
+            "位相法": list(isouhou_details),
+            "天中殺": tenchu_str
+        }
+
+
+class NenunPillar(LuckPillar):
+    # 年運の1行 (dict のキーの順だけが大運と異なる)
+    __slots__ = ()
+
+    def to_dict(self):
+        kanshi, judai, junidai, isouhou_details, tenchu_str = self.engine.get_kanshi_details(self.code)
+        return {
+            "西暦": self.year,
+            "年齢": self.age,
+            "干支": kanshi,
+            "十大主星": judai,
+            "十二大従星": junidai,
+            "位相法": list(isouhou_details),
+            "天中殺": tenchu_str
+        }
+
+
+class Daiun:
+    # 大運: 立運・順行/逆行と各サイクルの LuckPillar
+    __slots__ = ("ritsuen", "is_shunko", "pillars")
+
+    def __init__(self, ritsuen, is_shunko, pillars):
+        self.ritsuen = ritsuen
+        self.is_shunko = is_shunko
+        self.pillars = pillars
+
+    def to_dict(self):
+        return {
+            "立運": self.ritsuen,
+            "方向": "順行" if self.is_shunko else "逆行",
+            "サイクル": [p.to_dict() for p in self.pillars]
+        }
+
+
+class NatalChart:
+    # 性別に依存しない命式の結果。年運は (開始年, 終了年) の範囲だけを持ち、行は出力時に作る
+    __slots__ = ("engine", "nenun_start", "nenun_end")
+
+    def __init__(self, engine, nenun_range=None):
+        self.engine = engine
+        if nenun_range is None:
+            nenun_range = (engine.year, engine.year + 100)
+        self.nenun_start, self.nenun_end = nenun_range
+
+    def nenun(self):
+        return self.engine.get_nenun(self.nenun_start, max(0, self.nenun_end - self.nenun_start))
+
+    def to_dict(self, sections=None):
+        # sections: 出力する項目 (REPORT_SECTIONS の部分集合, None なら大運以外の全項目)
+        engine = self.engine
+        builders = {
+            "陰占": engine._report_insen,
+            "陽占": engine._report_yousen,
+            "天中殺": engine._report_tenchusatsu,
+            "異常干支": lambda: engine.get_ijou_kanshi_codes(engine.kanshi_codes),
+            "位相法": lambda: engine.get_isouhou_codes(engine.kanshi_codes),
+            "年運": lambda: [p.to_dict() for p in self.nenun()],
+            "宇宙盤": lambda: {"干支番号": [c + 1 for c in engine.kanshi_codes]},
+            "数理法": lambda: engine.energy.to_dict(),
+            "八門法": lambda: engine.get_hachimonhou(Kanshi.GAN_WX[engine.day_gan], engine.energy.by_wx),
+        }
+        if sections is None:
+            sections = SanmeiEngine.REPORT_SECTIONS
+        unknown = [s for s in sections if s not in SanmeiEngine.REPORT_SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown report section: {', '.join(unknown)}")
+        return {s: builders[s]() for s in SanmeiEngine.REPORT_SECTIONS if s in sections and s != "大運"}
+
+
+# ============================================
+# 事前計算テーブル (import時に一度だけ構築)
+# ============================================
+def _load_setsuiri_table(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"SETU":
+        raise ValueError(f"Invalid setsuiri table: {path}")
+    first_year, n_years = struct.unpack("<HH", data[4:8])
+    table = array("H")
+    table.frombytes(data[8:8 + n_years * 12 * 2])
+    if sys.byteorder != "little":
+        table.byteswap()
+    return first_year, table
+
+
+def _relation_rules_fingerprint():
+    # 位相法の判定に使う定数の指紋 (スナップショットが現行ルールで作られたかの確認用)
+    rules = (
+        Kanshi.TIAN_GAN, Kanshi.DI_ZHI, sorted(Kanshi.WU_XING.items()),
+        SanmeiEngine.SHIGO_PAIRS, SanmeiEngine.TAICHU_PAIRS, SanmeiEngine.GAI_PAIRS, SanmeiEngine.HA_PAIRS,
+        SanmeiEngine.KEI_OUKI_PAIRS, SanmeiEngine.KEI_SEIKI_PAIRS, SanmeiEngine.KEI_KOKI_PAIRS,
+        SanmeiEngine.JIKEI_ZHI, SanmeiEngine.KANGOU_PAIRS, SanmeiEngine.HANKAI_TRIPLETS,
+        sorted(SanmeiEngine.DI_ZHI_TO_GAN_MAP.items()),
+        [getattr(SanmeiEngine, name) for name in sorted(vars(SanmeiEngine)) if name.startswith("REL_")],
+    )
+    return zlib.crc32(repr(rules).encode("utf-8"))
+
+
+def _load_relation_table(path):
+    # b"RELT" + uint32 ルール指紋 + uint16 要素数 + uint16 x 要素数 (リトルエンディアン)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != b"RELT" or len(data) < 10:
+        return None
+    fingerprint, count = struct.unpack("<IH", data[4:10])
+    if fingerprint != _relation_rules_fingerprint() or count != 60 * 60 or len(data) != 10 + count * 2:
+        return None
+    table = array("H")
+    table.frombytes(data[10:])
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tolist()
+
+
+def _build_relation_table():
+    def pair_set(pairs):
+        return {frozenset(p) for p in pairs}
+
+    shigo = pair_set(SanmeiEngine.SHIGO_PAIRS)
+    taichu = pair_set(SanmeiEngine.TAICHU_PAIRS)
+    gai = pair_set(SanmeiEngine.GAI_PAIRS)
+    ha = pair_set(SanmeiEngine.HA_PAIRS)
+    kei_ouki = pair_set(SanmeiEngine.KEI_OUKI_PAIRS)
+    kei_seiki = pair_set(SanmeiEngine.KEI_SEIKI_PAIRS)
+    kei_koki = pair_set(SanmeiEngine.KEI_KOKI_PAIRS)
+    kangou = pair_set(SanmeiEngine.KANGOU_PAIRS)
+    zhi_wx = {z: Kanshi.WU_XING[g] for z, g in SanmeiEngine.DI_ZHI_TO_GAN_MAP.items()}
+
+    table = [0] * (60 * 60)
+    for k1 in range(60):
+        g1, z1 = Kanshi.KANSHI_BY_ID[k1 + 1]
+        for k2 in range(60):
+            g2, z2 = Kanshi.KANSHI_BY_ID[k2 + 1]
+            z_pair = frozenset((z1, z2))
+            flags = 0
+            if frozenset((g1, g2)) in kangou: flags |= SanmeiEngine.REL_KANGOU
+            if z_pair in shigo: flags |= SanmeiEngine.REL_SHIGO
+            if z_pair in taichu: flags |= SanmeiEngine.REL_TAICHU
+            if z_pair in gai: flags |= SanmeiEngine.REL_GAI
+            if z_pair in ha: flags |= SanmeiEngine.REL_HA
+            if z1 == z2 and z1 in SanmeiEngine.JIKEI_ZHI: flags |= SanmeiEngine.REL_JIKEI
+            if z_pair in kei_ouki: flags |= SanmeiEngine.REL_KEI_OUKI
+            if z_pair in kei_seiki: flags |= SanmeiEngine.REL_KEI_SEIKI
+            if z_pair in kei_koki: flags |= SanmeiEngine.REL_KEI_KOKI
+            if z1 != z2 and any(z1 in t and z2 in t for t in SanmeiEngine.HANKAI_TRIPLETS):
+                flags |= SanmeiEngine.REL_HANKAI
+                if g1 == g2: flags |= SanmeiEngine.REL_DAIHANKAI
+            if zhi_wx[z1] == zhi_wx[z2]: flags |= SanmeiEngine.REL_HIWA
+            # 相剋: 干の番号差が 4 or 6 (例: 甲(0) vs 戊(4) -> 木剋土, 甲(0) vs 庚(6) -> 金剋木)
+            g_diff = abs(Kanshi.GAN_INDEX[g1] - Kanshi.GAN_INDEX[g2])
+            if g_diff in (4, 6) and z_pair in taichu: flags |= SanmeiEngine.REL_TENKOKU_CHICHU
+            table[k1 * 60 + k2] = flags
+    return table
+
+
+def _build_tables():
+    gan_list, zhi_list = Kanshi.TIAN_GAN, Kanshi.DI_ZHI
+    wx_index = {wx: i for i, wx in enumerate(Kanshi.WU_XING_ORDER)}
+
+    # --- 干支の基本表 ---
+    Kanshi.GAN_INDEX = {g: i for i, g in enumerate(gan_list)}
+    Kanshi.ZHI_INDEX = {z: i for i, z in enumerate(zhi_list)}
+    Kanshi.KANSHI_BY_ID = [None] + [(gan_list[(i-1)%10], zhi_list[(i-1)%12]) for i in range(1, 61)]
+    Kanshi.KANSHI_ID = {k: i for i, k in enumerate(Kanshi.KANSHI_BY_ID) if k}
+    Kanshi.KANSHI_NAME = [g + z for g, z in Kanshi.KANSHI_BY_ID[1:]]
+    Kanshi.WU_XING_INDEX = {c: wx_index[wx] for c, wx in Kanshi.WU_XING.items()}
+    Kanshi.GAN_WX = [Kanshi.WU_XING_INDEX[g] for g in gan_list]
+    Kanshi.ZHI_WX = [Kanshi.WU_XING_INDEX[z] for z in zhi_list]
+    Kanshi.GAN_YY = [0 if Kanshi.YIN_YANG[g] == "+" else 1 for g in gan_list]
+    Kanshi.ZHI_YY = [0 if Kanshi.YIN_YANG[z] == "+" else 1 for z in zhi_list]
+
+    # --- 五行関係 (十大主星の前提) ---
+    rel_names = ["比和", "生出", "剋出", "剋入", "生入"]
+    relationship = {}
+    for c1, wx1 in Kanshi.WU_XING_INDEX.items():
+        for c2, wx2 in Kanshi.WU_XING_INDEX.items():
+            yy = "同" if Kanshi.YIN_YANG[c1] == Kanshi.YIN_YANG[c2] else "異"
+            relationship[(c1, c2)] = (rel_names[(wx2 - wx1) % 5], yy)
+    SanmeiEngine.RELATIONSHIP_TABLE = relationship
+
+    # --- 十大主星 ---
+    SanmeiEngine.JUDAI_SHUSEI_MATRIX = [
+        [SanmeiEngine.JUDAI_SHUSEI_MAP[relationship[(g1, g2)]] for g2 in gan_list]
+        for g1 in gan_list
+    ]
+    SanmeiEngine.JUDAI_SHUSEI_LOOKUP = {
+        (g1, g2): SanmeiEngine.JUDAI_SHUSEI_MATRIX[i][j]
+        for i, g1 in enumerate(gan_list) for j, g2 in enumerate(gan_list)
+    }
+
+    # --- 十二大従星とスコア ---
+    SanmeiEngine.JUNIDAI_JUSEI_MATRIX = [
+        [SanmeiEngine.JUNIDAI_JUSEI_TABLE[g][z] for z in zhi_list] for g in gan_list
+    ]
+    SanmeiEngine.JUNIDAI_SCORE_MATRIX = [
+        [SanmeiEngine.JUNIDAI_JUSEI_SCORE[star] for star in row] for row in SanmeiEngine.JUNIDAI_JUSEI_MATRIX
+    ]
+    SanmeiEngine.JUNIDAI_JUSEI_LOOKUP = {
+        (g, z): SanmeiEngine.JUNIDAI_JUSEI_MATRIX[i][j]
+        for i, g in enumerate(gan_list) for j, z in enumerate(zhi_list)
+    }
+    SanmeiEngine.JUNIDAI_SCORE_LOOKUP = {
+        (g, z): SanmeiEngine.JUNIDAI_SCORE_MATRIX[i][j]
+        for i, g in enumerate(gan_list) for j, z in enumerate(zhi_list)
+    }
+
+    # --- 蔵干・天中殺・異常干支 ---
+    SanmeiEngine.ZOKAN_STEMS = [
+        tuple(Kanshi.GAN_INDEX[g] for g, d in SanmeiEngine.ZOKAN_TABLE[z] if g) for z in zhi_list
+    ]
+    SanmeiEngine.ZOKAN_BY_DAY = [
+        [Kanshi.GAN_INDEX[SanmeiEngine.get_zokan(z, n)] if n else None for n in range(31)] for z in zhi_list
+    ]
+    SanmeiEngine.TENCHUSATSU_ZHI_MASK = [
+        sum(1 << Kanshi.ZHI_INDEX[z] for z in group) for group in SanmeiEngine.TENCHUSATSU_BY_SHUN
+    ]
+    # --- 数理法の柱ごとの増分 ---
+    SanmeiEngine.ENERGY_STEM_COUNT = [
+        tuple(((c % 10,) + SanmeiEngine.ZOKAN_STEMS[c % 12]).count(g) for g in range(10)) for c in range(60)
+    ]
+    SanmeiEngine.ENERGY_BRANCH_SCORE = [
+        tuple(row[z] for row in SanmeiEngine.JUNIDAI_SCORE_MATRIX) for z in range(12)
+    ]
+    ijou_type = [None] * 60
+    for k_id in SanmeiEngine.NORMAL_IJOU_KANSHI:
+        ijou_type[k_id - 1] = "通常異常干支"
+    for k_id in SanmeiEngine.ANGO_IJOU_KANSHI:
+        ijou_type[k_id - 1] = "暗合異常干支"
+    SanmeiEngine.IJOU_KANSHI_TYPE = ijou_type
+
+    # --- 位相法 (60干支 x 60干支 の関係フラグ) ---
+    SanmeiEngine.RELATION_TABLE = (
+        _load_relation_table(SanmeiEngine.RELATION_TABLE_PATH) or _build_relation_table()
+    )
+
+    # --- 節入り表 ---
+    SanmeiEngine.SETSUIRI_FIRST_YEAR, SanmeiEngine.SETSUIRI_TABLE = _load_setsuiri_table(SanmeiEngine.SETSUIRI_TABLE_PATH)
+
+
+_build_tables()
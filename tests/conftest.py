@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# The API module reads its configuration at import time: run it against the
+# local stub backend with throwaway SQLite files
+os.environ.setdefault("AI_BACKEND", "stub")
+os.environ.setdefault("AI_WARM_ON_STARTUP", "0")
+os.environ.setdefault("AI_JOBS_DB", os.path.join(tempfile.mkdtemp(prefix="kantei-tests-"), "jobs.sqlite3"))
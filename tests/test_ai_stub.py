@@ -0,0 +1,120 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp.backend import api
+from webapp.backend.ai_backend import StubBackend
+from webapp.backend.prefetch import Prefetcher
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def report(client):
+    return client.post("/calculate", json={"birthday": "1990-05-15", "gender": "M"}).json()["report"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_backend(monkeypatch):
+    # New stub per test (records its calls) and no cached readings from earlier tests
+    backend = StubBackend(text="鑑定結果です。" * 20, chunk_size=16)
+    monkeypatch.setattr(api, "ai_backend", backend)
+    api.ai_response_cache.clear()
+    return backend
+
+
+def sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = block.splitlines()
+        name = lines[0][len("event: "):] if lines[0].startswith("event: ") else None
+        events.append((name, json.loads(lines[-1][len("data: "):])))
+    return events
+
+
+def test_consult_returns_the_model_reading(client, report, fresh_backend):
+    r = client.post("/ai/consult", json={"report": report, "persona": "jiya"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["response"] == fresh_backend.text
+    assert body["prompt"]["estimated_tokens"] > 0
+    assert len(fresh_backend.calls) == 1
+    assert isinstance(fresh_backend.calls[0]["contents"], str)
+
+
+def test_repeated_consult_is_served_from_the_response_cache(client, report, fresh_backend):
+    client.post("/ai/consult", json={"report": report})
+    r = client.post("/ai/consult", json={"report": report})
+    assert r.json()["response"] == fresh_backend.text
+    assert r.headers["X-Cache"] == "HIT"
+    assert len(fresh_backend.calls) == 1
+
+
+def test_consult_stream_sends_start_chunks_done(client, report, fresh_backend):
+    r = client.post("/ai/consult/stream", json={"report": report})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(r.text)
+    assert events[0][0] == "start" and events[0][1]["cached"] is False
+    assert events[-1] == ("done", {})
+    chunks = [data["text"] for name, data in events[1:-1]]
+    assert len(chunks) > 1
+    assert "".join(chunks) == fresh_backend.text
+
+
+def test_consult_stream_reports_model_errors_as_an_event(client, report, fresh_backend):
+    fresh_backend.error = RuntimeError("model failed")
+    events = sse_events(client.post("/ai/consult/stream", json={"report": report}).text)
+    assert events[-1][0] == "error"
+    assert "model failed" in events[-1][1]["detail"]
+
+
+def test_follow_up_replays_history_as_alternating_turns(client, report, fresh_backend):
+    history = [{"role": "user", "content": "仕事運は？"}, {"role": "assistant", "content": "順調です。"}]
+    r = client.post("/ai/consult", json={"report": report, "message": "来年は？", "history": history})
+    assert r.status_code == 200
+    assert r.json()["prompt"]["verbatim_messages"] == 2
+    contents = fresh_backend.calls[0]["contents"]
+    assert [c.role for c in contents] == ["user", "user", "model", "user"]
+    assert contents[-1].parts[0].text.startswith("来年は？")
+
+
+def test_session_follow_up_keeps_the_conversation(client, report, fresh_backend):
+    session_id = client.post("/ai/session", json={"report": report}).json()["session_id"]
+    r = client.post(f"/ai/session/{session_id}/message", json={"message": "来年は？"})
+    assert r.status_code == 200
+    assert r.json()["response"] == fresh_backend.text
+    session = client.get(f"/ai/session/{session_id}").json()
+    assert [m["role"] for m in session["history"]] == ["assistant", "user", "assistant"]
+    assert session["history"][1]["content"] == "来年は？"
+
+
+def test_prefetched_reading_is_claimed_then_cached(client, fresh_backend, monkeypatch):
+    prefetcher = Prefetcher()
+    monkeypatch.setattr(api, "ai_prefetcher", prefetcher)
+    # A full /calculate starts the default reading in the background
+    report = client.post("/calculate", json={"birthday": "1975-11-03", "gender": "F"}).json()["report"]
+    assert prefetcher.stats()["started"] == 1
+    deadline = time.monotonic() + 5
+    while prefetcher.stats()["running"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(fresh_backend.calls) == 1
+
+    request = {"report": report, **api.PREFETCH_DEFAULTS}
+    r = client.post("/ai/consult", json=request)
+    assert r.headers["X-Cache"] == "PREFETCH"
+    assert r.json()["response"] == fresh_backend.text
+    assert prefetcher.stats()["claimed_done"] == 1
+    model_name, contents, config, _ = api.build_generation_request(api.AiConsultRequest(**request))
+    assert api.ai_response_cache.contains(api.response_cache_key(model_name, contents, config))
+
+    r = client.post("/ai/consult", json=request)
+    assert r.headers["X-Cache"] == "HIT"
+    assert r.json()["response"] == fresh_backend.text
+    assert len(fresh_backend.calls) == 1
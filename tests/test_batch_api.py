@@ -0,0 +1,35 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp.backend import api
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_rows_object_is_accepted(client):
+    r = client.post("/calculate/batch?fields=陰占", json={"rows": [{"birthday": "1990-05-15", "gender": "F"}]})
+    assert r.status_code == 200
+    (row,) = ndjson(r)
+    assert row["gender"] == "F" and "陰占" in row["report"]
+
+
+@pytest.mark.parametrize("body", [{"x": 1}, {"rows": "1990-05-15"}, "1990-05-15"])
+def test_body_without_rows_list_is_rejected(client, body):
+    assert client.post("/calculate/batch", json=body).status_code == 400
+
+
+@pytest.mark.parametrize("gender", [None, ""])
+def test_missing_gender_defaults_to_male(client, gender):
+    r = client.post("/calculate/batch?fields=陰占", json=[{"birthday": "1990-05-15", "gender": gender}])
+    (row,) = ndjson(r)
+    assert row["gender"] == "M"
@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp.backend import api
+
+CHART = {"birthday": "1990-05-15", "gender": "M"}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def full_report(client):
+    r = client.post("/calculate", json=CHART)
+    assert r.status_code == 200
+    return r.json()["report"]
+
+
+@pytest.mark.parametrize("fields", ["陰占", "陰占,陽占", "大運,年運", " 数理法 , 八門法 "])
+def test_fields_returns_only_the_requested_sections(client, full_report, fields):
+    wanted = [f.strip() for f in fields.split(",")]
+    r = client.post("/calculate", params={"fields": fields}, json=CHART)
+    assert r.status_code == 200
+    report = r.json()["report"]
+    assert sorted(report) == sorted(wanted)
+    assert all(report[f] == full_report[f] for f in wanted)
+
+
+@pytest.mark.parametrize("fields", ["bogus", "陰占,bogus"])
+def test_unknown_field_is_rejected(client, fields):
+    r = client.post("/calculate", params={"fields": fields}, json=CHART)
+    assert r.status_code == 400
+    assert "bogus" in r.json()["detail"]
@@ -0,0 +1,90 @@
+import threading
+
+from webapp.backend.ai_backend import ContextCacheRegistry, StubBackend
+
+MODEL = "gemini-3-pro-preview"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def registry(backend=None, clock=None):
+    return ContextCacheRegistry(backend or StubBackend(), ttl_seconds=3600, renew_margin=300, clock=clock or Clock())
+
+
+def test_handle_is_reused_until_close_to_expiry():
+    backend, clock = StubBackend(), Clock()
+    r = registry(backend, clock)
+    first = r.handle(MODEL, "prefix")
+    clock.now += 3000
+    assert r.handle(MODEL, "prefix") == first
+    assert (r.created, r.reused) == (1, 1)
+    assert len(backend.context_caches) == 1
+
+
+def test_handle_is_recreated_before_expiry():
+    backend, clock = StubBackend(), Clock()
+    r = registry(backend, clock)
+    first = r.handle(MODEL, "prefix")
+    clock.now += 3400  # inside the renew margin
+    second = r.handle(MODEL, "prefix")
+    assert second != first
+    assert r.created == 2
+    assert r.handle(MODEL, "prefix") == second
+
+
+def test_handles_are_per_model_and_prefix():
+    r = registry()
+    assert len({r.handle(MODEL, "a"), r.handle(MODEL, "b"), r.handle("gemini-3-flash-preview", "a")}) == 3
+
+
+class FailingBackend(StubBackend):
+    def create_context_cache(self, model, text, ttl_seconds):
+        raise RuntimeError("prefix below minimum cacheable size")
+
+
+def test_failed_creation_falls_back_and_backs_off():
+    clock = Clock()
+    r = registry(FailingBackend(), clock)
+    assert r.handle(MODEL, "prefix") is None
+    assert r.handle(MODEL, "prefix") is None
+    assert r.errors == 1  # not retried on every request
+    clock.now += 301
+    assert r.handle(MODEL, "prefix") is None
+    assert r.errors == 2
+
+
+class SlowBackend(StubBackend):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def create_context_cache(self, model, text, ttl_seconds):
+        if text == "slow":
+            self.started.set()
+            self.release.wait(5)
+        return super().create_context_cache(model, text, ttl_seconds)
+
+
+def test_slow_creation_does_not_block_other_keys_or_repeat():
+    backend = SlowBackend()
+    r = registry(backend)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(r.handle(MODEL, "slow"))) for _ in range(3)]
+    threads[0].start()
+    assert backend.started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    # Another prefix is served while the slow create is in flight
+    assert r.handle(MODEL, "fast") is not None
+    backend.release.set()
+    for t in threads:
+        t.join(5)
+    assert len(results) == 3 and len(set(results)) == 1 and results[0] is not None
+    assert r.created == 2
@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+from webapp.backend.ai_backend import StubBackend
+from webapp.backend.dispatch import HedgedDispatcher
+
+PRIMARY = "gemini-3-pro-preview"
+HEDGE = "gemini-3-flash-preview"
+
+
+def dispatcher(backend, hedge_after=0.05, deadline=2.0):
+    return HedgedDispatcher(backend, hedge_model=HEDGE, hedge_after=hedge_after, deadline=deadline, max_workers=4)
+
+
+def test_fast_primary_is_served_without_hedging():
+    d = dispatcher(StubBackend(text="primary"), hedge_after=1.0)
+    text, info = d.dispatch(PRIMARY, "prompt")
+    assert (text, info["path"], info["model"]) == ("primary", "primary", PRIMARY)
+    assert d.hedges_fired == 0
+
+
+def test_hedge_wins_when_primary_is_slow():
+    backend = StubBackend(text="answer", model_delays={PRIMARY: 1.0, HEDGE: 0.0})
+    d = dispatcher(backend)
+    text, info = d.dispatch(PRIMARY, "prompt")
+    assert (text, info["path"], info["model"]) == ("answer", "hedge", HEDGE)
+    assert d.hedges_fired == 1
+    assert d.cancelled == 1
+    assert d.stats()["served"]["hedge"] == 1
+
+
+def test_primary_error_falls_back_to_hedge_model():
+    backend = StubBackend(text="answer", model_errors={PRIMARY: RuntimeError("primary down")})
+    d = dispatcher(backend, hedge_after=10.0)
+    text, info = d.dispatch(PRIMARY, "prompt")
+    assert (text, info["path"], info["model"]) == ("answer", "fallback", HEDGE)
+    assert d.stats()["served"]["fallback"] == 1
+
+
+def test_both_models_failing_raises_the_last_error():
+    backend = StubBackend(model_errors={PRIMARY: RuntimeError("primary down"), HEDGE: RuntimeError("hedge down")})
+    d = dispatcher(backend)
+    with pytest.raises(RuntimeError, match="hedge down"):
+        d.dispatch(PRIMARY, "prompt")
+    assert d.stats()["served"]["error"] == 1
+
+
+def test_deadline_raises_timeout():
+    backend = StubBackend(model_delays={PRIMARY: 1.0, HEDGE: 1.0})
+    d = dispatcher(backend, deadline=0.2)
+    with pytest.raises(TimeoutError):
+        d.dispatch(PRIMARY, "prompt")
+    assert d.stats()["served"]["timeout"] == 1
+    assert d.cancelled == 2
+
+
+def test_deadline_is_a_504_from_the_api(monkeypatch):
+    from webapp.backend import api
+
+    backend = StubBackend(model_delays={PRIMARY: 1.0, HEDGE: 1.0})
+    monkeypatch.setattr(api, "ai_dispatcher", dispatcher(backend, deadline=0.2))
+    with pytest.raises(HTTPException) as excinfo:
+        api.call_model(PRIMARY, "prompt", None)
+    assert excinfo.value.status_code == 504
@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from sanmei_engine import EnergyProfile, Kanshi, SanmeiEngine
+from webapp.backend import api
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+def test_span_over_the_limit_is_rejected(client):
+    params = {"birthday": "1981-04-27", "from_year": 1900}
+    assert client.get("/energy", params={**params, "to_year": 2099}).status_code == 200
+    r = client.get("/energy", params={**params, "to_year": 2100})
+    assert r.status_code == 400
+    assert client.get("/energy", params={**params, "to_year": 1899}).status_code == 400
+
+
+def test_timeline_rows_match_the_scalar_energy_profile(client):
+    body = client.get("/energy", params={"birthday": "1981-04-27", "gender": "M"}).json()
+    assert (body["from_year"], body["to_year"], len(body["items"])) == (1981, 2080, 100)
+
+    engine = SanmeiEngine(1981, 4, 27)
+    natal = [engine.year_code, engine.month_code, engine.day_code]
+    assert body["宿命"] == EnergyProfile.from_codes(natal).to_dict()
+
+    code = {name: c for c, name in enumerate(Kanshi.KANSHI_NAME)}
+    for row in (body["items"][0], body["items"][7], body["items"][50]):
+        pillars = natal + [code[row["年運"]]] + ([code[row["大運"]]] if row["大運"] else [])
+        expected = EnergyProfile.from_codes(pillars).to_dict()
+        assert row["総エネルギー"] == expected["総エネルギー"]
+        assert row["五行分布"] == expected["五行分布"]
+    # No 大運 before 立運 (age 7)
+    assert body["items"][6]["大運"] is None and body["items"][7]["大運"] == "辛卯"
@@ -0,0 +1,151 @@
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp.backend import api, guard
+from webapp.backend.ai_backend import StubBackend
+from webapp.backend.guard import CallGuard, CircuitBreaker, CircuitOpen, ConcurrencyLimiter, Overloaded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # One clock for the breaker's timeouts and the guard's call latencies
+    clock = FakeClock()
+    monkeypatch.setattr(guard, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def call_guard(clock):
+    return CallGuard(
+        ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=5),
+        CircuitBreaker(failure_threshold=3, slow_call_seconds=60, reset_timeout=30, clock=clock),
+    )
+
+
+def fail(call_guard):
+    with pytest.raises(RuntimeError):
+        with call_guard.call():
+            raise RuntimeError("upstream error")
+
+
+def test_full_queue_is_rejected(call_guard):
+    with call_guard.call():
+        with pytest.raises(Overloaded):
+            with call_guard.call():
+                pass
+        with pytest.raises(Overloaded):
+            call_guard.check()
+    assert call_guard.limiter.stats()["rejected_queue_full"] == 1
+    # The rejection says nothing about the backend
+    assert call_guard.breaker.consecutive_failures == 0
+    with call_guard.call():
+        pass
+
+
+def test_breaker_opens_after_consecutive_failures(call_guard, clock):
+    for _ in range(2):
+        fail(call_guard)
+    assert call_guard.breaker.state == "closed"
+    fail(call_guard)
+    assert call_guard.breaker.state == "open"
+
+    clock.advance(10)
+    with pytest.raises(CircuitOpen) as e:
+        with call_guard.call():
+            pass
+    assert e.value.retry_after == 20
+    assert call_guard.breaker.stats()["rejected"] == 1
+
+
+def test_success_resets_the_failure_count(call_guard):
+    fail(call_guard)
+    fail(call_guard)
+    with call_guard.call():
+        pass
+    fail(call_guard)
+    assert call_guard.breaker.state == "closed"
+
+
+def test_slow_calls_count_as_failures(call_guard, clock):
+    for _ in range(3):
+        with call_guard.call():
+            clock.advance(61)
+    assert call_guard.breaker.state == "open"
+
+
+def test_streams_are_judged_by_time_to_first_chunk(call_guard, clock):
+    for _ in range(3):
+        with call_guard.call() as call:
+            clock.advance(1)
+            call.first_chunk()
+            clock.advance(300)
+    assert call_guard.breaker.state == "closed"
+
+
+def test_half_open_probe_closes_the_breaker(call_guard, clock):
+    for _ in range(3):
+        fail(call_guard)
+    clock.advance(30)
+    with call_guard.call():
+        assert call_guard.breaker.state == "half_open"
+        # Only one probe at a time
+        with pytest.raises(CircuitOpen):
+            call_guard.breaker.before_call()
+    assert call_guard.breaker.state == "closed"
+    with call_guard.call():
+        pass
+
+
+def test_failed_probe_reopens_the_breaker(call_guard, clock):
+    for _ in range(3):
+        fail(call_guard)
+    clock.advance(30)
+    fail(call_guard)
+    assert call_guard.breaker.state == "open"
+    assert call_guard.breaker.times_opened == 2
+    with pytest.raises(CircuitOpen):
+        call_guard.check()
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+def test_open_breaker_returns_503_with_retry_after(client, call_guard, clock, monkeypatch):
+    backend = StubBackend(text="鑑定結果です。")
+    monkeypatch.setattr(api, "ai_backend", backend)
+    monkeypatch.setattr(api, "ai_guard", call_guard)
+    api.ai_response_cache.clear()
+    report = client.post("/calculate", json={"birthday": "1990-05-15", "gender": "M"}).json()["report"]
+    for _ in range(3):
+        fail(call_guard)
+    clock.advance(12)
+
+    r = client.post("/ai/consult", json={"report": report})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "18"
+    r = client.post("/ai/consult/stream", json={"report": report})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "18"
+    assert backend.calls == []
+
+    clock.advance(18)
+    r = client.post("/ai/consult", json={"report": report})
+    assert r.status_code == 200
+    assert call_guard.breaker.state == "closed"
+    assert len(backend.calls) == 1
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from webapp.backend.history import DIGEST_HEADER, compact_history
+
+
+def chat(n_pairs, size=400):
+    history = []
+    for i in range(n_pairs):
+        history.append(SimpleNamespace(role="user", content=f"質問{i}" + "あ" * size))
+        history.append(SimpleNamespace(role="assistant", content=f"回答{i}" + "い" * size))
+    return history
+
+
+def test_under_budget_history_is_replayed_as_sent():
+    history = chat(3)
+    digest, verbatim, stats = compact_history(history, budget=100_000)
+    assert digest is None
+    assert verbatim == history
+    assert stats["verbatim_messages"] == 6
+
+
+def test_over_budget_keeps_last_question_and_answer_verbatim():
+    history = chat(6)
+    # Room for nothing but the minimum: the last question and its answer must survive
+    digest, verbatim, stats = compact_history(history, fixed_tokens=0, budget=10)
+    assert history[-2] in verbatim and history[-1] in verbatim
+    assert verbatim[0].role == "assistant"
+    assert [m.role for m in verbatim] == ["assistant", "user", "assistant"]
+    assert stats["verbatim_messages"] == 3
+    assert stats["summarized_messages"] + stats["dropped_messages"] == len(history) - 3
+
+
+def test_older_turns_become_digest_lines():
+    history = chat(6)
+    # Room for the last three messages verbatim plus a few digest lines
+    digest, verbatim, stats = compact_history(history, budget=1400)
+    assert digest.startswith(DIGEST_HEADER)
+    assert history[-1] in verbatim and history[-2] in verbatim
+    assert verbatim[0].role == "assistant"
+    assert stats["summarized_messages"] > 0
+    assert "相談者: 質問4" in digest
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+from webapp.backend.jobs import JobStore
+
+
+def test_recovery_only_fails_jobs_of_dead_processes(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    alive = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        jobs = {}
+        for name, pid in (("dead", dead.pid), ("alive", alive.pid), ("legacy", None)):
+            jobs[name] = store.create()
+            store.update(jobs[name], "running")
+            store._db.execute("UPDATE ai_jobs SET owner_pid = ? WHERE id = ?", (pid, jobs[name]))
+        store._db.commit()
+        done = store.create()
+        store.update(done, "done", result="鑑定")
+
+        # A second worker opening the same file
+        JobStore(path)
+
+        assert store.get(jobs["alive"])["status"] == "running"
+        assert store.get(done)["status"] == "done"
+        for name in ("dead", "legacy"):
+            job = store.get(jobs[name])
+            assert (job["status"], job["status_code"]) == ("error", 503)
+    finally:
+        alive.kill()
+        alive.wait()
+
+
+def test_running_jobs_of_this_process_survive_another_store(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    job_id = store.create()
+    store.update(job_id, "running")
+    # A store opened by another worker process must not touch this live process's jobs
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", f"from webapp.backend.jobs import JobStore; JobStore({path!r})"],
+                   check=True, cwd=root)
+    assert store.get(job_id)["status"] == "running"
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from webapp.backend import api
+
+BIRTHDAY = "1981-04-27"
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def report(client):
+    return client.post("/calculate", json={"birthday": BIRTHDAY, "gender": "M"}).json()["report"]
+
+
+def luck(client, **params):
+    r = client.get("/luck", params={"birthday": BIRTHDAY, "gender": "M", **params})
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_nenun_first_page(client, report):
+    body = luck(client, page_size=30)
+    assert (body["kind"], body["from_year"], body["to_year"], body["total"]) == ("nenun", 1981, 2080, 100)
+    assert [row["西暦"] for row in body["items"]] == list(range(1981, 2011))
+    # Rows are the same as the full report's
+    assert body["items"] == report["年運"][:30]
+
+
+def test_nenun_last_page(client, report):
+    body = luck(client, page=4, page_size=30)
+    assert body["page"] == 4
+    assert [row["西暦"] for row in body["items"]] == list(range(2071, 2081))
+    assert body["items"] == report["年運"][90:]
+
+
+def test_page_past_the_end_is_empty(client):
+    body = luck(client, page=5, page_size=30)
+    assert body["items"] == [] and body["total"] == 100
+    assert luck(client, kind="daiun", page=3, page_size=5)["items"] == []
+
+
+def test_nenun_explicit_range(client):
+    body = luck(client, from_year=2024, to_year=2026)
+    assert body["total"] == 3
+    assert [row["西暦"] for row in body["items"]] == [2024, 2025, 2026]
+
+
+def test_daiun_pages(client, report):
+    daiun = report["大運"]
+    first = luck(client, kind="daiun", page_size=3)
+    assert (first["立運"], first["方向"], first["total"]) == (daiun["立運"], daiun["方向"], 10)
+    assert first["items"] == daiun["サイクル"][:3]
+    assert [row["年齢"] for row in first["items"]] == [7, 17, 27]
+
+    last = luck(client, kind="daiun", page=4, page_size=3)
+    assert last["items"] == daiun["サイクル"][9:]
+
+
+@pytest.mark.parametrize("params", [{"kind": "getsuun"}, {"from_year": 2000, "to_year": 1999}, {"page": 0}])
+def test_bad_parameters_are_rejected(client, params):
+    r = client.get("/luck", params={"birthday": BIRTHDAY, **params})
+    assert r.status_code in (400, 422)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from webapp.backend.sessions import InMemorySessionStore, SqliteSessionStore
+
+
+def test_sqlite_session_roundtrip(tmp_path):
+    store = SqliteSessionStore(path=str(tmp_path / "sessions.sqlite3"))
+    session = store.create(persona="jiya", report={"陰占": {}})
+    store.append(session, {"role": "assistant", "content": "鑑定"})
+    loaded = store.get(session["id"])
+    assert loaded["persona"] == "jiya"
+    assert loaded["history"] == [{"role": "assistant", "content": "鑑定"}]
+
+
+def test_concurrent_follow_ups_from_two_workers_keep_every_turn(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    workers = [SqliteSessionStore(path=path), SqliteSessionStore(path=path)]
+    session_id = workers[0].create(persona="jiya")["id"]
+
+    # Every follow-up starts from the same (stale) snapshot, as concurrent requests would
+    snapshots = [worker.get(session_id) for worker in workers for _ in range(10)]
+    start = threading.Barrier(len(snapshots))
+
+    def follow_up(i, snapshot):
+        start.wait()
+        store = workers[i % 2]
+        store.append(snapshot, {"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"})
+
+    threads = [threading.Thread(target=follow_up, args=(i, s)) for i, s in enumerate(snapshots)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    history = workers[1].get(session_id)["history"]
+    assert len(history) == 2 * len(snapshots)
+    assert sorted(m["content"] for m in history if m["role"] == "user") == sorted(f"q{i}" for i in range(20))
+    # Each follow-up's question and answer stay adjacent
+    for question, answer in zip(history[::2], history[1::2]):
+        assert question["content"][1:] == answer["content"][1:]
+
+
+class _SlowHistory(list):
+    # Widens the read-modify-write window in append() so an unlocked store loses turns
+    def __add__(self, other):
+        time.sleep(0.001)
+        return _SlowHistory(list.__add__(self, other))
+
+
+def test_concurrent_in_memory_appends_keep_every_turn():
+    store = InMemorySessionStore()
+    session = store.create(persona="jiya")
+    session["history"] = _SlowHistory()
+    start = threading.Barrier(2)
+
+    def follow_up(i):
+        start.wait()
+        for n in range(50):
+            store.append(store.get(session["id"]), {"role": "user", "content": f"q{i}-{n}"},
+                         {"role": "assistant", "content": f"a{i}-{n}"})
+
+    threads = [threading.Thread(target=follow_up, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    history = store.get(session["id"])["history"]
+    assert len(history) == 2 * 2 * 50
+    assert {m["content"] for m in history if m["role"] == "user"} == {f"q{i}-{n}" for i in range(2) for n in range(50)}
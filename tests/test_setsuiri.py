@@ -0,0 +1,106 @@
+import os
+import struct
+
+import pytest
+
+from sanmei_engine import SanmeiEngine
+
+
+# 立春 2024 falls on 2/4 at 17:27 JST
+def test_birth_minutes_around_risshun_flips_year_and_month():
+    before = SanmeiEngine(2024, 2, 4, 17, 26).get_full_report("F")["陰占"]
+    after = SanmeiEngine(2024, 2, 4, 17, 27).get_full_report("F")["陰占"]
+    assert (before["年"], before["月"]) == ("(40) 癸卯", "(2) 乙丑")
+    assert (after["年"], after["月"]) == ("(41) 甲辰", "(3) 丙寅")
+    assert before["日"] == after["日"]
+
+
+def test_is_before_setsuiri_compares_the_exact_minute():
+    assert SanmeiEngine.get_setsuiri_day(2024, 2) == 4
+    assert SanmeiEngine.get_setsuiri_minute(2024, 2) == 3 * 1440 + 17 * 60 + 27
+    assert SanmeiEngine.is_before_setsuiri(2024, 2, 4, 17, 26)
+    assert not SanmeiEngine.is_before_setsuiri(2024, 2, 4, 17, 27)
+    assert SanmeiEngine.is_before_setsuiri(2024, 2, 4, 17)  # a missing minute means :00
+
+
+def test_unknown_hour_counts_the_setsuiri_day_as_the_new_month():
+    assert SanmeiEngine.is_before_setsuiri(2024, 2, 3)
+    assert not SanmeiEngine.is_before_setsuiri(2024, 2, 4)
+    assert SanmeiEngine(2024, 2, 4).get_full_report("F")["陰占"]["年"] == "(41) 甲辰"
+
+
+@pytest.mark.parametrize("year", [1799, 2200, 2300])
+def test_years_outside_the_table_fall_back_to_the_formula(year):
+    assert SanmeiEngine.get_setsuiri_minute(year, 2) is None
+    setsu_day = SanmeiEngine.get_setsuiri_day(year, 2)
+    assert setsu_day == SanmeiEngine._approx_setsuiri_day(year, 2)
+    # Without a table entry the setsuiri day is the new month even when the time is known
+    assert not SanmeiEngine.is_before_setsuiri(year, 2, setsu_day, 0, 0)
+    assert SanmeiEngine.is_before_setsuiri(year, 2, setsu_day - 1, 23, 59)
+
+
+def test_table_edges_are_covered():
+    assert SanmeiEngine.get_setsuiri_minute(1800, 1) is not None
+    assert SanmeiEngine.get_setsuiri_minute(2199, 12) is not None
+
+
+def test_setsuiri_table_file_layout():
+    with open(SanmeiEngine.SETSUIRI_TABLE_PATH, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"SETU"
+    first_year, n_years = struct.unpack("<HH", data[4:8])
+    assert (first_year, n_years) == (1800, 400)
+    assert len(data) == 8 + n_years * 12 * 2 == os.path.getsize(SanmeiEngine.SETSUIRI_TABLE_PATH)
+    assert SanmeiEngine.SETSUIRI_FIRST_YEAR == first_year
+    assert len(SanmeiEngine.SETSUIRI_TABLE) == n_years * 12
+    # Every 節入り falls between the 3rd and the 9th
+    assert all(2 * 1440 <= m < 9 * 1440 for m in SanmeiEngine.SETSUIRI_TABLE)
+
+
+# Reference charts under the setsuiri table: the dates of validation_results.csv and verification_5cases_log.txt
+GOLDEN = [
+    ("1900/02/05", "M", "(37) 庚子", "(15) 戊寅", "(46) 己酉", "石門星", 10, "順行"),
+    ("1911/11/11", "F", "(48) 辛亥", "(36) 己亥", "(22) 乙酉", "石門星", 9, "順行"),
+    ("1923/09/01", "M", "(60) 癸亥", "(57) 庚申", "(14) 丁丑", "司禄星", -2, "逆行"),
+    ("1930/02/04", "F", "(7) 庚午", "(15) 戊寅", "(22) 乙酉", "司禄星", 1, "逆行"),
+    ("1945/08/15", "M", "(22) 乙酉", "(21) 甲申", "(53) 丙辰", "鳳閣星", 2, "逆行"),
+    ("1952/02/29", "F", "(29) 壬辰", "(39) 壬寅", "(42) 乙巳", "石門星", 8, "逆行"),
+    ("1964/10/10", "M", "(41) 甲辰", "(11) 甲戌", "(29) 壬辰", "玉堂星", 9, "順行"),
+    ("1972/05/15", "F", "(49) 壬子", "(42) 乙巳", "(43) 丙午", "禄存星", 3, "逆行"),
+    ("1980/01/01", "M", "(56) 己未", "(13) 丙子", "(10) 癸酉", "貫索星", -1, "逆行"),
+    ("1986/05/10", "F", "(3) 丙寅", "(30) 癸巳", "(51) 甲寅", "禄存星", 1, "逆行"),
+    ("1992/04/18", "M", "(9) 壬申", "(41) 甲辰", "(1) 甲子", "禄存星", 6, "順行"),
+    ("1995/01/17", "F", "(11) 甲戌", "(14) 丁丑", "(45) 戊申", "調舒星", 4, "逆行"),
+    ("2000/01/01", "M", "(16) 己卯", "(13) 丙子", "(55) 戊午", "司禄星", -1, "逆行"),
+    ("2000/02/04", "F", "(17) 庚辰", "(15) 戊寅", "(29) 壬辰", "車騎星", 1, "逆行"),
+    ("2005/08/30", "M", "(22) 乙酉", "(21) 甲申", "(23) 丙戌", "禄存星", 8, "逆行"),
+    ("2011/03/11", "F", "(28) 辛卯", "(28) 辛卯", "(2) 乙丑", "貫索星", 8, "順行"),
+    ("2015/12/31", "M", "(32) 乙未", "(25) 戊子", "(18) 辛巳", "鳳閣星", 8, "逆行"),
+    ("2019/05/01", "F", "(36) 己亥", "(5) 戊辰", "(35) 戊戌", "貫索星", 12, "順行"),
+    ("2020/02/29", "M", "(37) 庚子", "(15) 戊寅", "(39) 壬寅", "鳳閣星", 2, "順行"),
+    ("2024/02/04", "F", "(41) 甲辰", "(3) 丙寅", "(35) 戊戌", "貫索星", 1, "逆行"),
+    ("1905/07/07", "M", "(42) 乙巳", "(19) 壬午", "(44) 丁未", "貫索星", 1, "逆行"),
+    ("1920/12/31", "F", "(57) 庚申", "(25) 戊子", "(60) 癸亥", "貫索星", 8, "逆行"),
+    ("1958/12/23", "M", "(35) 戊戌", "(1) 甲子", "(11) 甲戌", "玉堂星", 5, "順行"),
+    ("1969/07/20", "F", "(46) 己酉", "(8) 辛未", "(33) 丙申", "調舒星", 6, "順行"),
+    ("1989/01/07", "M", "(5) 戊辰", "(2) 乙丑", "(4) 丁卯", "車騎星", 9, "順行"),
+    ("1989/01/08", "F", "(5) 戊辰", "(2) 乙丑", "(5) 戊辰", "司禄星", 1, "逆行"),
+    ("2025/01/01", "M", "(41) 甲辰", "(13) 丙子", "(7) 庚午", "調舒星", 11, "順行"),
+    ("1978/04/01", "F", "(55) 戊午", "(52) 乙卯", "(30) 癸巳", "鳳閣星", 1, "逆行"),
+    ("1982/10/20", "M", "(59) 壬戌", "(47) 庚戌", "(13) 丙子", "石門星", 6, "順行"),
+    ("1999/09/09", "F", "(16) 己卯", "(10) 癸酉", "(1) 甲子", "牽牛星", 10, "順行"),
+    ("1981/04/27", "M", "(58) 辛酉", "(29) 壬辰", "(12) 乙亥", "司禄星", 7, "逆行"),
+    ("1999/12/31", "F", "(16) 己卯", "(13) 丙子", "(54) 丁巳", "車騎星", 2, "順行"),
+    ("2005/06/15", "M", "(22) 乙酉", "(19) 壬午", "(7) 庚午", "牽牛星", 3, "逆行"),
+    ("1958/08/25", "F", "(35) 戊戌", "(57) 庚申", "(11) 甲戌", "車騎星", 6, "逆行"),
+    ("2011/03/11", "M", "(28) 辛卯", "(28) 辛卯", "(2) 乙丑", "貫索星", 2, "逆行"),
+]
+
+
+@pytest.mark.parametrize("date, gender, nen, getsu, nichi, mune, ritsuun, direction", GOLDEN)
+def test_golden_charts(date, gender, nen, getsu, nichi, mune, ritsuun, direction):
+    year, month, day = map(int, date.split("/"))
+    report = SanmeiEngine(year, month, day).get_full_report(gender)
+    assert (report["陰占"]["年"], report["陰占"]["月"], report["陰占"]["日"]) == (nen, getsu, nichi)
+    assert report["陽占"]["十大主星"]["胸"] == mune
+    assert (report["大運"]["立運"], report["大運"]["方向"]) == (ritsuun, direction)
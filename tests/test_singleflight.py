@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from webapp.backend.singleflight import SingleFlight
+
+
+class SlowWork:
+    """Blocks until released, so every caller joins the same flight first."""
+
+    def __init__(self, result="reading", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        if not self.release.wait(5):
+            raise TimeoutError("never released")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(flights, work, n):
+    start = threading.Barrier(n)
+    outcomes = [None] * n
+
+    def caller(i):
+        start.wait()
+        try:
+            outcomes[i] = ("ok", flights.do("key", work))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    # Release the leader only once every other caller is waiting on its flight
+    deadline = time.monotonic() + 5
+    while flights.stats()["coalesced"] < n - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    work.release.set()
+    for t in threads:
+        t.join()
+    return outcomes
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    work = SlowWork()
+    outcomes = run_concurrently(flights, work, 8)
+
+    assert work.calls == 1
+    assert all(kind == "ok" and result == "reading" for kind, (result, _) in outcomes)
+    assert sorted(coalesced for _, (_, coalesced) in outcomes) == [False] + [True] * 7
+    assert flights.stats() == {"in_flight": 0, "executed": 1, "coalesced": 7}
+
+
+def test_leader_exception_reaches_every_waiter():
+    flights = SingleFlight()
+    error = ValueError("upstream failed")
+    work = SlowWork(error=error)
+    outcomes = run_concurrently(flights, work, 5)
+
+    assert work.calls == 1
+    assert all(kind == "error" and e is error for kind, e in outcomes)
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_finished_flights_are_not_reused():
+    flights = SingleFlight()
+    work = SlowWork()
+    work.release.set()
+    assert flights.do("key", work) == ("reading", False)
+    assert flights.do("key", work) == ("reading", False)
+    assert work.calls == 2
+    assert flights.stats()["coalesced"] == 0
+
+
+class ClientGone(BaseException):
+    pass
+
+
+def test_followers_retry_when_the_leader_is_abandoned():
+    flights = SingleFlight()
+    work = SlowWork(error=ClientGone())
+    results = []
+
+    def leader():
+        with pytest.raises(ClientGone):
+            flights.do("key", work)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    deadline = time.monotonic() + 5
+    while work.calls < 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    follower = threading.Thread(target=lambda: results.append(flights.do("key", lambda: "own reading")))
+    follower.start()
+    while flights.stats()["coalesced"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    work.release.set()
+    leader_thread.join()
+    follower.join()
+
+    # The abandoned flight is not an answer: the follower runs the work itself
+    assert results == [("own reading", False)]
+    assert flights.stats() == {"in_flight": 0, "executed": 2, "coalesced": 1}
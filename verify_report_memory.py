@@ -0,0 +1,83 @@
+"""
+レポートのメモリ・割り当て量の計測 (tracemalloc)。
+
+  1. get_full_report 1回あたりの割り当てブロック数とピーク
+  2. ReportCache に N 件の命式 (全項目 + 大運) を載せたときの保持メモリ
+  3. キャッシュ済みレポートの取得と JSON 化にかかる時間
+    python verify_report_memory.py
+"""
+import datetime
+import json
+import time
+import tracemalloc
+
+from sanmei_engine import SanmeiEngine
+from webapp.backend.cache import ReportCache
+
+N_CHARTS = 1000
+CURRENT_YEAR = 2026
+FIELDS = SanmeiEngine.REPORT_SECTIONS
+
+
+def birthdays(n):
+    start = datetime.date(1950, 1, 1)
+    return [start + datetime.timedelta(days=7 * i) for i in range(n)]
+
+
+def measure_single_report():
+    engine = SanmeiEngine(1990, 5, 15)
+    engine.get_full_report("M")  # 詳細表・エネルギーのメモ化を済ませた状態で計る
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    report = engine.get_full_report("M")
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    size = sum(s.size_diff for s in stats if s.size_diff > 0)
+    del report
+    return blocks, size, peak
+
+
+def measure_cache():
+    cache = ReportCache(natal_size=N_CHARTS, daiun_size=N_CHARTS)
+    dates = birthdays(N_CHARTS)
+    tracemalloc.start()
+    started = time.perf_counter()
+    for d in dates:
+        cache.get_report(d.year, d.month, d.day, "M", CURRENT_YEAR, FIELDS)
+    miss_seconds = (time.perf_counter() - started) / N_CHARTS
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for d in dates:
+        cache.get_report(d.year, d.month, d.day, "M", CURRENT_YEAR, FIELDS)
+    hit_seconds = (time.perf_counter() - started) / N_CHARTS
+
+    started = time.perf_counter()
+    for d in dates:
+        json.dumps(cache.get_report(d.year, d.month, d.day, "M", CURRENT_YEAR, FIELDS), ensure_ascii=False)
+    json_seconds = (time.perf_counter() - started) / N_CHARTS
+    return retained, peak, miss_seconds, hit_seconds, json_seconds
+
+
+def main():
+    blocks, size, peak = measure_single_report()
+    print("get_full_report (memoized engine)")
+    print(f"  allocated blocks  {blocks:8d}")
+    print(f"  allocated size    {size / 1024:8.1f} KiB")
+    print(f"  peak              {peak / 1024:8.1f} KiB")
+
+    retained, peak, miss_seconds, hit_seconds, json_seconds = measure_cache()
+    print(f"ReportCache with {N_CHARTS} charts (all sections + 大運)")
+    print(f"  retained          {retained / 1024 / 1024:8.2f} MiB ({retained / N_CHARTS / 1024:.1f} KiB per chart)")
+    print(f"  peak              {peak / 1024 / 1024:8.2f} MiB")
+    print(f"  cache miss        {miss_seconds * 1e6:8.1f} us per report (under tracemalloc)")
+    print(f"  cache hit         {hit_seconds * 1e6:8.1f} us per report")
+    print(f"  cache hit + JSON  {json_seconds * 1e6:8.1f} us per report")
+
+
+if __name__ == "__main__":
+    main()
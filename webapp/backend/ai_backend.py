@@ -0,0 +1,318 @@
+import datetime
+import os
+import threading
+import time
+import urllib.request
+
+from webapp.backend.singleflight import SingleFlight
+
+
+# ============================================
+# GenAI backends
+# ============================================
+# Every backend exposes the same two calls:
+#   generate(model, contents, config) -> str
+#   generate_stream(model, contents, config) -> iterator of text chunks
+# so endpoints can run against Vertex AI or a local stub interchangeably.
+
+DEFAULT_PROJECT_ID = "kantei-app-486114"
+# Gemini 3 Preview models require the GLOBAL endpoint
+DEFAULT_LOCATION = "global"
+
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+def genai_types():
+    # google.genai / google.auth are imported on first AI use, not at startup:
+    # together they are about half of the API's import time, and instances that
+    # only serve /calculate never need them
+    from google.genai import types
+    return types
+
+# Access tokens live ~1h; refresh in the background well before they expire
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=10)
+TOKEN_CHECK_INTERVAL = 60
+
+
+def resolve_project_id(adc_project_id=None):
+    # Get project ID - Cloud Run sets this automatically
+    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT") or os.environ.get("GCLOUD_PROJECT") or adc_project_id
+    if not project_id:
+        # Try to get from metadata server
+        try:
+            req_url = "http://metadata.google.internal/computeMetadata/v1/project/project-id"
+            req_obj = urllib.request.Request(req_url, headers={"Metadata-Flavor": "Google"})
+            with urllib.request.urlopen(req_obj, timeout=2) as response:
+                project_id = response.read().decode()
+        except Exception:
+            project_id = DEFAULT_PROJECT_ID  # Fallback
+    return project_id
+
+
+class VertexBackend:
+    """
+    Vertex AI via google-genai (Cloud Run provides ADC via the metadata server).
+    Project id, credentials and the client are resolved once per process
+    (on first use, or up front via warm()) and a daemon thread keeps the
+    access token fresh, so a request only pays for the model call itself.
+    """
+
+    def __init__(self, location=DEFAULT_LOCATION, refresh_margin=TOKEN_REFRESH_MARGIN,
+                 check_interval=TOKEN_CHECK_INTERVAL):
+        self.location = location
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.project_id = None
+        self.credentials = None
+        self.metrics = {}
+        self._client_obj = None
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def warm(self):
+        self._client()
+        return self.metrics
+
+    def _client(self):
+        if self._client_obj is None:
+            with self._lock:
+                if self._client_obj is None:
+                    self._client_obj = self._resolve()
+        return self._client_obj
+
+    def _resolve(self):
+        started = time.perf_counter()
+        from google import genai
+        import google.auth
+        import google.auth.exceptions
+        imported = time.perf_counter()
+        adc_project_id = None
+        try:
+            self.credentials, adc_project_id = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+            self._refresh_token()
+        except google.auth.exceptions.DefaultCredentialsError as e:
+            # Let google-genai fall back to its own credential lookup
+            print(f"GenAI credentials not resolved up front: {e}")
+            self.credentials = None
+        credentials_done = time.perf_counter()
+
+        self.project_id = resolve_project_id(adc_project_id)
+        project_done = time.perf_counter()
+
+        client = genai.Client(
+            vertexai=True,
+            project=self.project_id,
+            location=self.location,
+            credentials=self.credentials,
+        )
+        finished = time.perf_counter()
+
+        self.metrics = {
+            "import_seconds": round(imported - started, 4),
+            "credentials_seconds": round(credentials_done - imported, 4),
+            "project_id_seconds": round(project_done - credentials_done, 4),
+            "client_seconds": round(finished - project_done, 4),
+            "total_seconds": round(finished - started, 4),
+            "resolved_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "token_refreshes": self.metrics.get("token_refreshes", 0),
+            "token_refresh_errors": self.metrics.get("token_refresh_errors", 0),
+        }
+        print(f"GenAI client ready in {self.metrics['total_seconds']}s (project={self.project_id})")
+
+        if self.credentials is not None and self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="genai-token-refresh", daemon=True)
+            self._refresher.start()
+        return client
+
+    def _refresh_token(self):
+        import google.auth.transport.requests
+        self.credentials.refresh(google.auth.transport.requests.Request())
+        self.metrics["token_refreshes"] = self.metrics.get("token_refreshes", 0) + 1
+
+    def _token_expiring(self):
+        if not self.credentials.valid:
+            return True
+        expiry = self.credentials.expiry  # naive UTC, None = never expires
+        if expiry is None:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return expiry - now < self.refresh_margin
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                if self._token_expiring():
+                    self._refresh_token()
+            except Exception as e:
+                self.metrics["token_refresh_errors"] = self.metrics.get("token_refresh_errors", 0) + 1
+                print(f"GenAI token refresh failed: {e}")
+
+    def status(self):
+        expiry = self.credentials.expiry if self.credentials is not None else None
+        return {
+            "backend": "vertex",
+            "ready": self._client_obj is not None,
+            "project_id": self.project_id,
+            "location": self.location,
+            "token_expiry": expiry.isoformat() if expiry else None,
+            "startup": self.metrics,
+        }
+
+    def create_context_cache(self, model, text, ttl_seconds):
+        types = genai_types()
+        cache = self._client().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=text)])],
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        return cache.name
+
+    def generate(self, model, contents, config=None):
+        response = self._client().models.generate_content(model=model, contents=contents, config=config)
+        return response.text
+
+    def generate_stream(self, model, contents, config=None):
+        stream = self._client().models.generate_content_stream(model=model, contents=contents, config=config)
+        for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend:
+    """
+    Local stand-in for Vertex AI (tests / offline development).
+    Returns `text` split into `chunk_size` pieces, sleeping `delay` seconds
+    before the first chunk and `chunk_delay` between chunks.
+    `model_delays` / `model_errors` override `delay` / `error` per model name
+    (e.g. a slow primary and a fast hedge model).
+    """
+
+    def __init__(self, text=None, chunk_size=40, delay=0.0, chunk_delay=0.0, error=None,
+                 model_delays=None, model_errors=None):
+        self.text = text or "（スタブ応答）算命学の鑑定結果を読み解きます。"
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.error = error
+        self.model_delays = model_delays or {}
+        self.model_errors = model_errors or {}
+        self.calls = []
+        self.context_caches = {}
+
+    def warm(self):
+        return {}
+
+    def create_context_cache(self, model, text, ttl_seconds):
+        name = f"stub-caches/{len(self.context_caches) + 1}"
+        self.context_caches[name] = {"model": model, "text": text, "ttl": ttl_seconds}
+        return name
+
+    def status(self):
+        return {"backend": "stub", "ready": True, "calls": len(self.calls)}
+
+    def generate(self, model, contents, config=None):
+        return "".join(self.generate_stream(model, contents, config))
+
+    def generate_stream(self, model, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        delay = self.model_delays.get(model, self.delay)
+        error = self.model_errors.get(model, self.error)
+        if delay:
+            time.sleep(delay)
+        if error:
+            raise error
+        for i in range(0, len(self.text), self.chunk_size):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield self.text[i:i + self.chunk_size]
+
+
+class ContextCacheRegistry:
+    """
+    Explicit provider-side cache handles for static prompt prefixes, keyed by
+    (model, prefix). Handles are created on first use and recreated shortly
+    before their TTL runs out. If creation fails (e.g. the prefix is below
+    the provider's minimum cacheable size), None is returned and the caller
+    sends the prefix inline as before.
+    """
+
+    def __init__(self, backend, ttl_seconds=3600, renew_margin=300, clock=time.time):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin = renew_margin
+        self.clock = clock
+        self._handles = {}
+        self._retry_after = {}
+        self._lock = threading.Lock()
+        self._creating = SingleFlight()
+        self.created = 0
+        self.reused = 0
+        self.errors = 0
+
+    def handle(self, model, text):
+        key = (model, text)
+        with self._lock:
+            now = self.clock()
+            entry = self._handles.get(key)
+            if entry and entry[1] - now > self.renew_margin:
+                self.reused += 1
+                return entry[0]
+            if now < self._retry_after.get(key, 0):
+                return None
+        # The remote create runs outside the registry lock, once per key; other keys
+        # (personas, models) keep being served while it is in flight
+        flight, leader = self._creating.begin(key)
+        if not leader:
+            if entry and entry[1] > now:
+                # Being renewed: the current handle is still valid meanwhile
+                with self._lock:
+                    self.reused += 1
+                return entry[0]
+            return flight.wait()
+        name = None
+        try:
+            name = self._create(model, text)
+        finally:
+            self._creating.finish(key, flight, result=name)
+        return name
+
+    def _create(self, model, text):
+        key = (model, text)
+        try:
+            name = self.backend.create_context_cache(model, text, self.ttl_seconds)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                # Don't retry on every request; try again after renew_margin seconds
+                self._retry_after[key] = self.clock() + self.renew_margin
+            print(f"Context cache creation failed ({model}): {e}")
+            return None
+        with self._lock:
+            self._handles[key] = (name, self.clock() + self.ttl_seconds)
+            self.created += 1
+        return name
+
+    def stats(self):
+        return {
+            "handles": len(self._handles),
+            "ttl": self.ttl_seconds,
+            "created": self.created,
+            "reused": self.reused,
+            "errors": self.errors,
+            "creating": self._creating.stats()["in_flight"],
+        }
+
+
+def create_backend(name=None):
+    # AI_BACKEND=stub runs everything locally without Vertex AI
+    name = name or os.environ.get("AI_BACKEND", "vertex")
+    if name == "stub":
+        # AI_STUB_DELAY simulates model latency (e.g. for load tests)
+        return StubBackend(delay=float(os.environ.get("AI_STUB_DELAY", "0")))
+    if name == "vertex":
+        return VertexBackend()
+    raise ValueError(f"Unknown AI backend: {name}")
@@ -0,0 +1,79 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from webapp.backend.cache import ReportCache
+
+
+# ============================================
+# Process pool for /calculate/batch
+# ============================================
+# Batch rows are pure CPU work on the engine; in the API process they share
+# the GIL with every other request. With BATCH_PROCESSES > 0 the unique rows
+# of a large batch are computed in chunks by worker processes instead. The
+# pool uses a forkserver that has already imported this module, so each
+# worker starts with the engine tables built and shares them copy-on-write.
+
+_report_cache = None
+
+
+def compute_rows(keys, field_list, current_year):
+    """Worker side: [(birthday, gender)] -> [({"report": ...} or None, error or None)]."""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache()
+    results = []
+    for birthday, gender in keys:
+        try:
+            y, m, d = map(int, birthday.split("-"))
+            results.append(({"report": _report_cache.get_report(y, m, d, gender, current_year, field_list)}, None))
+        except ValueError as e:
+            results.append((None, str(e)))
+        except Exception as e:
+            print(f"Batch row error: {e}")
+            results.append((None, "Internal Server Error"))
+    return results
+
+
+class BatchPool:
+    def __init__(self, processes=2, chunk_size=100):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def _pool(self):
+        # Started on first use, inside the worker process that serves the batch
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            self.batches += 1
+            return self._executor
+
+    def map(self, keys, field_list, current_year):
+        """Yield (key, (report, error)) in the order of `keys`, chunk by chunk as they finish."""
+        chunks = [keys[i:i + self.chunk_size] for i in range(0, len(keys), self.chunk_size)]
+        results = self._pool().map(compute_rows, chunks, [field_list] * len(chunks), [current_year] * len(chunks))
+        for chunk, chunk_results in zip(chunks, results):
+            with self._lock:
+                self.rows += len(chunk)
+            yield from zip(chunk, chunk_results)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "chunk_size": self.chunk_size,
+            "started": self._executor is not None,
+            "batches": self.batches,
+            "rows": self.rows,
+        }
@@ -0,0 +1,208 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sanmei_engine import SanmeiEngine
+
+
+# ============================================
+# Bounded LRU cache (thread-safe)
+# ============================================
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def peek(self, key, default=None):
+        # Lookup without touching recency or hit/miss counters
+        with self._lock:
+            return self._data.get(key, default)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# ============================================
+# /calculate report cache
+# ============================================
+class ReportCache:
+    """
+    /calculate のレポートを2段で保持するキャッシュ。
+    - natal: 生年月日 -> NatalChart (engine と整数コードだけ)。男女で共有する
+    - daiun: (生年月日, 性別, 現在年) -> Daiun・テキストレポート
+    キャッシュには結果オブジェクトだけを置き、返却用の dict は要求ごとに to_dict() で作る
+    (fields で一部の項目だけを要求できる)。
+    テキストレポートは「直近20年の年運」を含むため現在年もキーに含める。
+    """
+
+    # テキストレポートのフィールド名 (REPORT_SECTIONS 以外に fields で指定できる)
+    TEXT_FIELD = "output_text"
+    FIELDS = SanmeiEngine.REPORT_SECTIONS + [TEXT_FIELD]
+
+    def __init__(self, natal_size=1024, daiun_size=2048):
+        self.natal = LRUCache(natal_size)
+        self.daiun = LRUCache(daiun_size)
+
+    def get_engine(self, y, m, d):
+        # 命式ごとの engine (年運・大運の詳細メモ化もここに乗る)
+        return self._get_chart(y, m, d).engine
+
+    def _get_chart(self, y, m, d):
+        key = (y, m, d)
+        chart = self.natal.get(key)
+        if chart is None:
+            chart = SanmeiEngine(y, m, d).get_natal_chart()
+            self.natal.put(key, chart)
+        return chart
+
+    def validate_fields(self, fields):
+        unknown = [f for f in fields if f not in self.FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(unknown)}")
+
+    def get_report(self, y, m, d, gender, current_year, fields=None):
+        if fields is None:
+            fields = self.FIELDS
+        self.validate_fields(fields)
+
+        chart = self._get_chart(y, m, d)
+        engine = chart.engine
+
+        daiun_entry = None
+        if "大運" in fields or self.TEXT_FIELD in fields:
+            key = (y, m, d, gender, current_year)
+            daiun_entry = self.daiun.get(key)
+            if daiun_entry is None:
+                daiun_entry = {"大運": engine.get_daiun(gender)}
+                self.daiun.put(key, daiun_entry)
+            if self.TEXT_FIELD in fields and self.TEXT_FIELD not in daiun_entry:
+                daiun_entry[self.TEXT_FIELD] = self._text_report(engine, daiun_entry["大運"], current_year)
+
+        natal = chart.to_dict([f for f in fields if f in SanmeiEngine.REPORT_SECTIONS])
+        report = engine.merge_report(natal, daiun_entry["大運"].to_dict() if "大運" in fields else None)
+        if self.TEXT_FIELD in fields:
+            report[self.TEXT_FIELD] = daiun_entry[self.TEXT_FIELD]
+        return report
+
+    def _text_report(self, engine, daiun, current_year):
+        # テキストに載るのは直近20年の年運だけなので、その範囲だけを出力する
+        natal = engine.get_natal_chart(engine.text_report_nenun_range(current_year)).to_dict()
+        return engine.format_as_text_report(engine.merge_report(natal, daiun.to_dict()))
+
+    def clear(self):
+        self.natal.clear()
+        self.daiun.clear()
+
+    def stats(self):
+        return {"natal": self.natal.stats(), "daiun": self.daiun.stats()}
+
+
+# ============================================
+# /ai/consult response cache
+# ============================================
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+class ResponseCache:
+    """
+    初回鑑定の AI 応答を「組み立て済みプロンプト + モデル設定」のハッシュで保持するキャッシュ。
+    プロンプトには今日の日付 (JST) が入るため、エントリは翌日0時 (JST) か ttl 秒後の早い方で失効する。
+    """
+
+    def __init__(self, maxsize=512, ttl=86400, clock=time.time):
+        self.entries = LRUCache(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(model, contents, config=None):
+        config_json = config.model_dump_json(exclude_none=True) if config is not None else None
+        payload = json.dumps([model, contents, config_json], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expires_at(self, now):
+        tomorrow = datetime.datetime.fromtimestamp(now, JST).date() + datetime.timedelta(days=1)
+        rollover = datetime.datetime.combine(tomorrow, datetime.time(), JST).timestamp()
+        return min(now + self.ttl, rollover)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self.clock() >= entry[0]:
+            self.entries.pop(key)
+            entry = None
+            with self._lock:
+                self.expired += 1
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[1]
+
+    def contains(self, key):
+        entry = self.entries.peek(key)
+        return entry is not None and self.clock() < entry[0]
+
+    def put(self, key, text):
+        self.entries.put(key, (self._expires_at(self.clock()), text))
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.entries.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.entries.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# ============================================
+# Hedged / fallback model dispatch
+# ============================================
+# The primary model gets `hedge_after` seconds on its own. After that (or as
+# soon as it fails) the same prompt is sent to the hedge model and whichever
+# finishes first wins. Both run over generate_stream so the loser can really
+# be cancelled: its worker stops reading and closes the stream. Nothing is
+# returned after `deadline` seconds.
+
+class GenerationCancelled(Exception):
+    pass
+
+
+class HedgedDispatcher:
+    PATHS = ["primary", "hedge", "fallback", "timeout", "error"]
+
+    def __init__(self, backend, hedge_model="gemini-3-flash-preview", hedge_after=20.0, deadline=120.0,
+                 max_workers=16):
+        self.backend = backend
+        self.hedge_model = hedge_model
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-dispatch")
+        self._lock = threading.Lock()
+        self.served = {path: 0 for path in self.PATHS}
+        self.hedges_fired = 0
+        self.cancelled = 0
+
+    def _run(self, model, contents, config, cancel):
+        stream = self.backend.generate_stream(model, contents, config)
+        chunks = []
+        try:
+            for chunk in stream:
+                if cancel.is_set():
+                    raise GenerationCancelled(model)
+                chunks.append(chunk)
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        return "".join(chunks)
+
+    def _hedge_config(self, config):
+        # The hedge runs without HIGH thinking; explicit context caches are model-specific,
+        # so a request relying on one has no self-contained prompt to hedge with
+        if config is None:
+            return True, None
+        if getattr(config, "cached_content", None):
+            return False, None
+        return True, config.model_copy(update={"thinking_config": None})
+
+    def _record(self, path):
+        with self._lock:
+            self.served[path] += 1
+
+    def dispatch(self, model, contents, config=None):
+        """Return (text, {"path", "model", "seconds"}); raises TimeoutError past the deadline."""
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        can_hedge, hedge_config = self._hedge_config(config)
+        can_hedge = can_hedge and model != self.hedge_model
+
+        cancels = {"primary": threading.Event()}
+        running = {self._executor.submit(self._run, model, contents, config, cancels["primary"]): ("primary", model)}
+        hedged = False
+        error = None
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    self._record("timeout")
+                    raise TimeoutError(f"No model response within {self.deadline}s")
+                wait_until = deadline_at if hedged or not can_hedge else min(deadline_at, started + self.hedge_after)
+                done, _ = wait(running, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    role, served_model = running.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    path = role if role == "primary" or error is None else "fallback"
+                    self._record(path)
+                    return text, {"path": path, "model": served_model,
+                                  "seconds": round(time.monotonic() - started, 3)}
+
+                # Hedge once the primary is slow, or right away if it failed
+                if can_hedge and not hedged and (not running or time.monotonic() >= started + self.hedge_after):
+                    hedged = True
+                    with self._lock:
+                        self.hedges_fired += 1
+                    cancels["hedge"] = threading.Event()
+                    future = self._executor.submit(self._run, self.hedge_model, contents, hedge_config, cancels["hedge"])
+                    running[future] = ("hedge", self.hedge_model)
+            self._record("error")
+            raise error
+        finally:
+            # Cancel whatever is still running (the loser, or everything on timeout)
+            for future, (role, _) in running.items():
+                cancels[role].set()
+                future.cancel()
+                with self._lock:
+                    self.cancelled += 1
+
+    def generate(self, model, contents, config=None):
+        return self.dispatch(model, contents, config)[0]
+
+    def stats(self):
+        return {
+            "hedge_model": self.hedge_model,
+            "hedge_after": self.hedge_after,
+            "deadline": self.deadline,
+            "served": dict(self.served),
+            "hedges_fired": self.hedges_fired,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,194 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ============================================
+# Concurrency limit + circuit breaker for model calls
+# ============================================
+# Model calls hold a worker thread for their whole duration. The limiter
+# caps how many run at once and how many may wait for a slot; the breaker
+# fails fast while the upstream model keeps failing or is too slow, so
+# threads stay free for /calculate during an AI outage.
+
+class Overloaded(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"AI backend unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded wait queue: callers beyond `max_queue` waiters are rejected."""
+
+    def __init__(self, max_concurrent=8, max_queue=16, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def acquire(self, wait=True):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if not wait or self.waiting >= self.max_queue:
+                    self.rejected_queue_full += 1
+                    raise Overloaded("Too many AI requests in progress")
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.rejected_timeout += 1
+                raise Overloaded(f"No AI slot free within {self.queue_timeout}s")
+        with self._lock:
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures (calls slower
+    than `slow_call_seconds` count as failures); open -> half_open after
+    `reset_timeout`, where a single probe call decides between closed and open.
+    """
+
+    def __init__(self, failure_threshold=5, slow_call_seconds=60.0, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.reset_timeout - (self.clock() - self.opened_at)
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpen(self.reset_timeout)
+                self._probe_in_flight = True
+
+    def cancel_call(self):
+        # The call was admitted but never reached the backend (e.g. rejected by the limiter)
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, ok, seconds):
+        with self._lock:
+            self._probe_in_flight = False
+            if ok and seconds < self.slow_call_seconds:
+                self.consecutive_failures = 0
+                self.state = "closed"
+                return
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = self.clock()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "slow_call_seconds": self.slow_call_seconds,
+            "reset_timeout": self.reset_timeout,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class GuardedCall:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency = None
+
+    def first_chunk(self):
+        # Streams are judged by time to first chunk, not total generation time
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class CallGuard:
+    def __init__(self, limiter, breaker):
+        self.limiter = limiter
+        self.breaker = breaker
+
+    @contextmanager
+    def call(self, wait=True):
+        """Raises CircuitOpen / Overloaded before the call; records its outcome after."""
+        self.breaker.before_call()
+        try:
+            self.limiter.acquire(wait)
+        except Overloaded:
+            self.breaker.cancel_call()
+            raise
+        call = GuardedCall()
+        try:
+            yield call
+        except Exception:
+            self.breaker.record(False, time.monotonic() - call.started)
+            raise
+        except BaseException:
+            # Abandoned (e.g. the client disconnected mid-stream): no verdict on the backend
+            self.breaker.cancel_call()
+            raise
+        else:
+            latency = call.latency if call.latency is not None else time.monotonic() - call.started
+            self.breaker.record(True, latency)
+        finally:
+            self.limiter.release()
+
+    def check(self):
+        """Fail fast (without taking a slot or a probe) if a call would be rejected right now."""
+        breaker = self.breaker
+        if breaker.state == "open":
+            remaining = breaker.reset_timeout - (breaker.clock() - breaker.opened_at)
+            if remaining > 0:
+                raise CircuitOpen(remaining)
+        limiter = self.limiter
+        if limiter.active >= limiter.max_concurrent and limiter.waiting >= limiter.max_queue:
+            raise Overloaded("Too many AI requests in progress")
+
+    def stats(self):
+        return {"limiter": self.limiter.stats(), "breaker": self.breaker.stats()}
@@ -0,0 +1,83 @@
+import os
+import re
+
+from sanmei_engine import SanmeiEngine
+
+
+# ============================================
+# Token-budgeted history compaction
+# ============================================
+# Follow-up requests replay the whole conversation. Once the estimated size
+# passes the budget, the newest turns stay verbatim and older turns are
+# reduced to one-line digests (or dropped when even those don't fit), so
+# the prompt size stays roughly flat however long a chat runs.
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("AI_HISTORY_TOKEN_BUDGET", "16000"))
+# Always kept verbatim, even over budget (the previous answer + the question before it;
+# plus the answer before that question, so the verbatim part opens on an assistant turn)
+MIN_RECENT_MESSAGES = 2
+DIGEST_LINE_CHARS = 80
+DIGEST_HEADER = "【これまでの会話の要約】（古いやりとりは要点のみ記載）"
+
+# Same estimate as the engine's prompt renderer (~1 token per kana/kanji, ~4 ASCII chars per token)
+estimate_tokens = SanmeiEngine.estimate_tokens
+
+_MARKDOWN_PREFIX = re.compile(r"^[#>*\-\d.\s]+")
+
+
+def digest_line(role, content):
+    # First non-empty, non-heading line without markdown decoration, clipped
+    lines = [l for l in content.splitlines() if l.strip()]
+    body = [l for l in lines if not l.lstrip().startswith("#")] or lines
+    line = _MARKDOWN_PREFIX.sub("", body[0]).replace("**", "").strip() if body else ""
+    if len(line) > DIGEST_LINE_CHARS:
+        line = line[:DIGEST_LINE_CHARS] + "…"
+    return f"{'相談者' if role == 'user' else '鑑定師'}: {line}"
+
+
+def compact_history(history, fixed_tokens=0, budget=None, min_recent=MIN_RECENT_MESSAGES):
+    """
+    Split `history` (objects with .role / .content) for a prompt of at most
+    `budget` estimated tokens, `fixed_tokens` of which are already taken by
+    the system context and the new message.
+    Returns (digest_text or None, verbatim messages, stats).
+    When older turns are compacted, the verbatim part starts with an assistant
+    message so roles keep alternating after the opening user turn.
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    sizes = [estimate_tokens(m.content) for m in history]
+    remaining = budget - fixed_tokens
+
+    # Newest turns first, verbatim while they fit
+    cut = len(history)
+    while cut > 0 and (len(history) - cut < min_recent or sizes[cut - 1] <= remaining):
+        cut -= 1
+        remaining -= sizes[cut]
+    # Start the verbatim part on an assistant turn by taking in the answer before a
+    # leading question, so that question stays verbatim with its answer
+    # (an uncompacted history is replayed as sent)
+    while 0 < cut < len(history) and history[cut].role == "user":
+        cut -= 1
+        remaining -= sizes[cut]
+
+    # Older turns as digest lines, newest first, while they fit
+    lines = []
+    remaining -= estimate_tokens(DIGEST_HEADER)
+    for m in reversed(history[:cut]):
+        line = digest_line(m.role, m.content)
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+
+    digest = "\n".join([DIGEST_HEADER] + lines) if lines else None
+    verbatim = history[cut:]
+    stats = {
+        "history_messages": len(history),
+        "verbatim_messages": len(verbatim),
+        "summarized_messages": len(lines),
+        "dropped_messages": cut - len(lines),
+    }
+    return digest, verbatim, stats
@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ============================================
+# Background AI jobs
+# ============================================
+# POST /ai/jobs returns a job id at once and the reading is generated on a
+# bounded worker pool. Job state and results are kept in SQLite, so a
+# client whose connection dropped (proxy timeout, closed tab) can poll or
+# re-subscribe and fetch the finished reading instead of regenerating it.
+
+class QueueFull(Exception):
+    pass
+
+
+def _process_alive(pid):
+    # A job left by an earlier process that had this process's pid is not ours: this
+    # store has not started any job yet when it recovers
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite-backed job records (status: queued -> running -> done | error)."""
+
+    def __init__(self, path, ttl=86400, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ai_jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT, status_code INTEGER,"
+            " info TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, owner_pid INTEGER)"
+        )
+        if "owner_pid" not in {row[1] for row in self._db.execute("PRAGMA table_info(ai_jobs)")}:
+            self._db.execute("ALTER TABLE ai_jobs ADD COLUMN owner_pid INTEGER")
+        self._db.commit()
+        self._recover_orphans()
+
+    def _recover_orphans(self):
+        # Jobs run in the process that created them. Queued or running jobs whose process is
+        # gone will never finish; jobs of other live workers sharing the file are left alone,
+        # so this is safe whether the store is built once (preload) or in every worker
+        with self._lock:
+            rows = self._db.execute("SELECT id, owner_pid FROM ai_jobs WHERE status IN ('queued', 'running')").fetchall()
+            orphans = [(job_id,) for job_id, pid in rows if not _process_alive(pid)]
+            self._db.executemany(
+                "UPDATE ai_jobs SET status = 'error', error = 'Interrupted by a server restart', status_code = 503"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                orphans,
+            )
+            self._db.commit()
+        return len(orphans)
+
+    @property
+    def _db(self):
+        # One connection per process: a connection inherited across fork() must not be reused
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._pid = os.getpid()
+        return self._conn
+
+    def create(self, info=None):
+        now = self.clock()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("DELETE FROM ai_jobs WHERE updated_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "INSERT INTO ai_jobs (id, status, info, created_at, updated_at, owner_pid) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(info, ensure_ascii=False), now, now, os.getpid()),
+            )
+            self._db.commit()
+        return job_id
+
+    def update(self, job_id, status, result=None, error=None, status_code=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE ai_jobs SET status = ?, result = ?, error = ?, status_code = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, status_code, self.clock(), job_id),
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, result, error, status_code, info, created_at, updated_at FROM ai_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {"job_id": row[0], "status": row[1], "created_at": row[6], "updated_at": row[7]}
+        if row[5]:
+            job["prompt"] = json.loads(row[5])
+        if row[2] is not None:
+            job["response"] = row[2]
+        if row[3] is not None:
+            job["error"] = row[3]
+            job["status_code"] = row[4]
+        return job
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM ai_jobs GROUP BY status").fetchall())
+
+
+class JobQueue:
+    """
+    Runs `run(payload) -> text` for each job on `workers` threads. At most
+    `max_pending` jobs may be queued or running; beyond that submit() raises
+    QueueFull. `run` may raise an exception with `status_code` / `detail`
+    (e.g. HTTPException), which is recorded on the job.
+    """
+
+    def __init__(self, store, run, workers=4, max_pending=64):
+        self.store = store
+        self.run = run
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-job")
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.workers = workers
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, payload, info=None):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"Too many AI jobs pending (max {self.max_pending})")
+            self.pending += 1
+            self.submitted += 1
+        job_id = self.store.create(info)
+        self._executor.submit(self._work, job_id, payload)
+        return job_id
+
+    def _set(self, job_id, status, **fields):
+        self.store.update(job_id, status, **fields)
+        with self._changed:
+            self._changed.notify_all()
+
+    def _work(self, job_id, payload):
+        try:
+            self._set(job_id, "running")
+            try:
+                text = self.run(payload)
+            except Exception as e:
+                print(f"AI job {job_id} failed: {e}")
+                self._set(job_id, "error", error=str(getattr(e, "detail", e)),
+                          status_code=getattr(e, "status_code", 500))
+            else:
+                self._set(job_id, "done", result=text)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def wait(self, job_id, seen_status=None, timeout=15.0):
+        """Block until the job's status differs from `seen_status` (or timeout); returns the job."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job["status"] != seen_status:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, 1.0))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "stored": self.store.counts(),
+        }
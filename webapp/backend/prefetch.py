@@ -0,0 +1,87 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ============================================
+# Speculative prefetch of AI readings
+# ============================================
+# /calculate can start the reading most users ask for next. Jobs are keyed
+# like the response cache (prompt hash), kept for `ttl` seconds, and a
+# later /ai/consult with the same prompt claims the job: the finished text
+# if it is done, otherwise it waits on the in-flight generation instead of
+# starting a second one.
+
+class Prefetcher:
+    def __init__(self, max_concurrent=2, ttl=600, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.ttl = ttl
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="ai-prefetch")
+        self._jobs = {}  # key -> (future, started_at)
+        self._lock = threading.Lock()
+        self._running = 0
+        self.started = 0
+        self.skipped_budget = 0
+        self.skipped_duplicate = 0
+        self.claimed_done = 0
+        self.claimed_running = 0
+        self.failed = 0
+        self.expired = 0
+
+    def _purge(self, now):
+        stale = [k for k, (_, started_at) in self._jobs.items() if now - started_at > self.ttl]
+        for k in stale:
+            del self._jobs[k]
+        self.expired += len(stale)
+
+    def submit(self, key, fn, *args):
+        """Start fn(*args) in the background unless the job exists or the budget is used up."""
+        with self._lock:
+            self._purge(self.clock())
+            if key in self._jobs:
+                self.skipped_duplicate += 1
+                return False
+            if self._running >= self.max_concurrent:
+                self.skipped_budget += 1
+                return False
+            self._running += 1
+            self.started += 1
+            future = self._executor.submit(fn, *args)
+            self._jobs[key] = (future, self.clock())
+        future.add_done_callback(self._finished)
+        return True
+
+    def _finished(self, future):
+        with self._lock:
+            self._running -= 1
+            if future.exception() is not None:
+                self.failed += 1
+
+    def claim(self, key):
+        """Remove and return the job's future (done or still running), or None."""
+        with self._lock:
+            self._purge(self.clock())
+            entry = self._jobs.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0].done():
+                self.claimed_done += 1
+            else:
+                self.claimed_running += 1
+            return entry[0]
+
+    def stats(self):
+        return {
+            "jobs": len(self._jobs),
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "ttl": self.ttl,
+            "started": self.started,
+            "skipped_budget": self.skipped_budget,
+            "skipped_duplicate": self.skipped_duplicate,
+            "claimed_done": self.claimed_done,
+            "claimed_running": self.claimed_running,
+            "failed": self.failed,
+            "expired": self.expired,
+        }
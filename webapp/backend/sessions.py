@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from webapp.backend.cache import LRUCache
+
+
+# ============================================
+# AI conversation sessions
+# ============================================
+# A session holds everything a follow-up needs (chart text, persona, depth,
+# model and the conversation so far) so the browser only sends a session id
+# and the new message. Stores expose get / save / delete / stats; the
+# in-memory store is the default and others can be plugged in through
+# create_session_store().
+
+class InMemorySessionStore:
+    """Bounded LRU of sessions; sessions idle for longer than `ttl` seconds are dropped."""
+
+    def __init__(self, maxsize=1000, ttl=3600, clock=time.time):
+        self.sessions = LRUCache(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def create(self, **fields):
+        now = self.clock()
+        session = {"id": self.new_id(), "history": [], "created_at": now, "updated_at": now, **fields}
+        self.save(session)
+        with self._lock:
+            self.created += 1
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None and self.clock() - session["updated_at"] > self.ttl:
+            self.sessions.pop(session_id)
+            with self._lock:
+                self.expired += 1
+            return None
+        return session
+
+    def save(self, session):
+        session["updated_at"] = self.clock()
+        self.sessions.put(session["id"], session)
+
+    def append(self, session, *messages):
+        # History is replaced rather than mutated so in-flight readers keep a consistent snapshot.
+        # Concurrent follow-ups share the session dict, so the concatenation is done under the lock
+        with self._lock:
+            session["history"] = session["history"] + list(messages)
+            self.save(session)
+
+    def delete(self, session_id):
+        return self.sessions.pop(session_id) is not None
+
+    def stats(self):
+        return {
+            "store": "memory",
+            "size": len(self.sessions),
+            "maxsize": self.sessions.maxsize,
+            "ttl": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evictions": self.sessions.evictions,
+        }
+
+
+class SqliteSessionStore(InMemorySessionStore):
+    """
+    Sessions in a SQLite file (AI_SESSION_DB) shared by every worker process,
+    so a follow-up can land on a different worker than the one that created
+    the session. Beyond `maxsize` the least recently updated sessions are dropped.
+    """
+
+    def __init__(self, maxsize=1000, ttl=3600, clock=time.time, path=None):
+        self.path = path or os.environ.get(
+            "AI_SESSION_DB", os.path.join(tempfile.gettempdir(), "kantei_ai_sessions.sqlite3")
+        )
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ai_sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @property
+    def _db(self):
+        # One connection per process: a connection inherited across fork() must not be reused
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT data, updated_at FROM ai_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if self.clock() - row[1] > self.ttl:
+            self.delete(session_id)
+            with self._lock:
+                self.expired += 1
+            return None
+        return json.loads(row[0])
+
+    def _write(self, session):
+        # Caller holds self._lock and commits
+        session["updated_at"] = self.clock()
+        self._db.execute(
+            "INSERT OR REPLACE INTO ai_sessions (id, data, updated_at) VALUES (?, ?, ?)",
+            (session["id"], json.dumps(session, ensure_ascii=False), session["updated_at"]),
+        )
+        self.evictions += self._db.execute(
+            "DELETE FROM ai_sessions WHERE id IN"
+            " (SELECT id FROM ai_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        ).rowcount
+
+    def save(self, session):
+        with self._lock:
+            self._write(session)
+            self._db.commit()
+
+    def append(self, session, *messages):
+        # Read-modify-write in one BEGIN IMMEDIATE transaction: the write lock is taken
+        # before the stored history is read, so concurrent follow-ups on the same session
+        # (from any worker) append one after the other instead of overwriting each other
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT data FROM ai_sessions WHERE id = ?", (session["id"],)).fetchone()
+                history = json.loads(row[0])["history"] if row else session["history"]
+                session["history"] = history + list(messages)
+                self._write(session)
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+
+    def delete(self, session_id):
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM ai_sessions WHERE id = ?", (session_id,)).rowcount
+            self._db.commit()
+        return deleted > 0
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM ai_sessions").fetchone()[0]
+        return {
+            "store": "sqlite",
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+SESSION_STORES = {
+    "memory": InMemorySessionStore,
+    "sqlite": SqliteSessionStore,
+}
+
+
+def create_session_store(name=None):
+    name = name or os.environ.get("AI_SESSION_STORE", "memory")
+    if name not in SESSION_STORES:
+        raise ValueError(f"Unknown session store: {name}")
+    return SESSION_STORES[name](
+        maxsize=int(os.environ.get("AI_SESSION_MAX", "1000")),
+        ttl=int(os.environ.get("AI_SESSION_TTL", "3600")),
+    )
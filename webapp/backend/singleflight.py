@@ -0,0 +1,74 @@
+import threading
+
+
+# ============================================
+# Single-flight request coalescing
+# ============================================
+# Concurrent calls with the same key share one execution: the first caller
+# (the leader) runs the work, callers arriving while it is in flight wait
+# for its result (or its exception) instead of repeating it.
+
+class Abandoned(Exception):
+    """The leader gave up without a result (e.g. its client disconnected); followers retry."""
+
+
+class Flight:
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Coalesced call did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        """Return (flight, is_leader). A leader must call finish() exactly once."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            self.executed += 1
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.error = error
+        flight._done.set()
+
+    def do(self, key, fn, *args):
+        """Run fn(*args) once per concurrent key; returns (result, coalesced)."""
+        while True:
+            flight, leader = self.begin(key)
+            if not leader:
+                try:
+                    return flight.wait(), True
+                except Abandoned:
+                    continue
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                self.finish(key, flight, error=e if isinstance(e, Exception) else Abandoned())
+                raise
+            self.finish(key, flight, result=result)
+            return result, False
+
+    def stats(self):
+        return {"in_flight": len(self._flights), "executed": self.executed, "coalesced": self.coalesced}